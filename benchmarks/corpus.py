@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""Deterministic synthetic simfiles for benchmarks.
+
+Run as a script to write the corpus to a directory.
+"""
+
+import os
+import random
+import sys
+
+
+# Rows per measure that StepMania accepts.
+QUANTIZATIONS = [4, 8, 12, 16, 24, 32, 48, 64, 96, 192]
+
+GAMES = {
+    'dance-single': 4,
+    'dance-double': 8,
+}
+
+# name: arguments to make_simfile
+CORPUS = {
+    'single-4th': dict(measures=100, quantization=4),
+    'single-16th': dict(measures=200, quantization=16),
+    'single-192nd': dict(measures=200, quantization=192),
+    'double-16th': dict(game='dance-double', measures=200, quantization=16),
+    'double-long-holds': dict(
+        game='dance-double', measures=400, quantization=48, holds=0.3,
+        hold_length=768),
+    'many-bpms': dict(measures=200, quantization=16, bpm_changes=500),
+    'many-charts': dict(charts=20, measures=100, quantization=24),
+    'marathon': dict(game='dance-double', measures=2000, quantization=24),
+    'taps': dict(measures=400, quantization=96, holds=0, mines=0),
+    'template': dict(
+        game='dance-double', measures=200, quantization=16, template=True),
+    'long-template': dict(
+        game='dance-double', measures=2000, quantization=16, template=True),
+    'series-template': dict(
+        game='dance-double', measures=2000, quantization=16, template=True,
+        series=True),
+}
+
+
+def make_notes(rng, columns, measures, quantization, density=0.25,
+               holds=0.1, hold_length=192, mines=0.05):
+    """Return the measures of a random chart as text."""
+    choices = [q for q in QUANTIZATIONS if q <= quantization]
+    open_holds = [None] * columns
+    result = []
+    tick = 0
+    for _ in range(measures):
+        rows_count = rng.choice(choices)
+        step = 192 // rows_count
+        rows = []
+        for _ in range(rows_count):
+            row = ['0'] * columns
+            for col in range(columns):
+                if open_holds[col] is not None:
+                    if tick >= open_holds[col]:
+                        row[col] = '3'
+                        open_holds[col] = None
+                    continue
+
+                draw = rng.random()
+                if draw < density * holds:
+                    row[col] = rng.choice('24')
+                    open_holds[col] = tick + rng.randint(step, hold_length)
+                elif draw < density:
+                    row[col] = '1'
+                elif draw < density + mines:
+                    row[col] = 'M'
+            rows.append(''.join(row))
+            tick += step
+        result.append('\n'.join(rows))
+
+    if any(end is not None for end in open_holds):
+        last = ''.join('0' if end is None else '3' for end in open_holds)
+        result.append('\n'.join([last] + ['0' * columns] * 3))
+    return result
+
+
+def make_template(rng, columns, measures, quantization, series=False):
+    """Return the measures of a template chart for generator.py.
+
+    With `series`, the template is one trill through the whole chart,
+    after a single note in a column that is never used again.
+    """
+    if series:
+        rows = ['01'.ljust(columns, '0'), '001'.ljust(columns, '0')]
+        measure = '\n'.join(rows * (quantization // 2))
+        result = [measure] * measures
+        result[0] = '0001' + '0' * (columns - 4) + result[0][columns:]
+        return result
+
+    choices = [q for q in QUANTIZATIONS if q <= quantization]
+    result = []
+    for _ in range(measures):
+        rows = []
+        for _ in range(rng.choice(choices)):
+            row = ['0'] * columns
+            if rng.random() < 0.7:
+                row[rng.choice([7, 7, 7, 7, 7, 7, 1, 2])] = '1'
+            rows.append(''.join(row))
+        result.append('\n'.join(rows))
+    return result
+
+
+def make_simfile(seed=0, game='dance-single', charts=1, measures=100,
+                 quantization=16, bpm_changes=0, holds=0.1,
+                 hold_length=192, mines=0.05, template=False, series=False):
+    rng = random.Random(seed)
+    columns = GAMES[game]
+
+    bpms = ['0.000=150.000']
+    for i in range(bpm_changes):
+        beat = (i + 1) * measures * 4 / (bpm_changes + 1)
+        bpms.append('{:.3f}={:.3f}'.format(beat, rng.uniform(60, 300)))
+
+    parts = [
+        '#TITLE:Synthetic {};\n'.format(seed),
+        '#ARTIST:benchmarks/corpus.py;\n',
+        '#OFFSET:-0.100;\n',
+        '#BPMS:{};\n'.format('\n,'.join(bpms)),
+        '#STOPS:{:.3f}=0.500;\n'.format(measures * 2.0),
+    ]
+    for i in range(charts):
+        if template:
+            credit = 'template'
+            notes = make_template(
+                rng, columns, measures, quantization, series)
+        else:
+            credit = 'chart {}'.format(i)
+            notes = make_notes(
+                rng, columns, measures, quantization, holds=holds,
+                hold_length=hold_length, mines=mines)
+        parts.append(
+            '\n//---------------- {} - {} ----------------\n'.format(
+                game, credit))
+        parts.append(
+            '#NOTES:\n     {}:\n     {}:\n     Hard:\n     {}:\n'
+            '     0.000,0.000,0.000,0.000,0.000:\n{}\n;\n'.format(
+                game, credit, 10 + i % 10, '\n,\n'.join(notes)))
+    return ''.join(parts)
+
+
+def write_corpus(directory):
+    os.makedirs(directory, exist_ok=True)
+    paths = {}
+    for seed, (name, kwargs) in enumerate(sorted(CORPUS.items())):
+        path = os.path.join(directory, name + '.sm')
+        with open(path, 'w') as f:
+            f.write(make_simfile(seed, **kwargs))
+        paths[name] = path
+    return paths
+
+
+if __name__ == '__main__':
+    for name, path in sorted(write_corpus(sys.argv[1]).items()):
+        print(path)
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""Time pysm and the tools on the synthetic corpus.
+
+Results are written as JSON; pass an earlier result file with --compare
+to see how the timings changed.
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import runpy
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pysm
+import pysm.analysis
+import pysm.binary
+import pysm.transforms
+
+import corpus
+
+
+def load_tool(name):
+    return runpy.run_path(os.path.join(ROOT, name))
+
+
+def count_notes(simfile):
+    return sum(
+        len(ticks)
+        for chart in simfile.notes
+        for ticks, _ in chart.value.column_events()
+    )
+
+
+def benchmarks(paths):
+    """Yield `(name, input, setup, func, amount, unit)` for each benchmark.
+
+    `func(setup())` is timed; `amount` is how much work one call does,
+    in `unit`s.
+    """
+    texts = {}
+    for name, path in sorted(paths.items()):
+        with open(path) as f:
+            texts[name] = f.read()
+
+    for name, text in sorted(texts.items()):
+        size = len(text.encode('utf-8'))
+        yield ('loads', name, lambda text=text: text, pysm.loads, size, 'B')
+        yield ('loads-lazy', name, lambda text=text: text,
+               lambda text: pysm.loads(text, lazy=True), size, 'B')
+        yield ('load_path', name, lambda path=paths[name]: path,
+               pysm.load_path, size, 'B')
+        yield ('str', name, lambda text=text: pysm.loads(text), str, size, 'B')
+
+        cache = paths[name] + '.pysmc'
+        pysm.binary.save(pysm.loads(text), cache)
+        yield ('binary.load', name, lambda cache=cache: cache,
+               pysm.binary.load, size, 'B')
+
+    def parsed(name):
+        return lambda: pysm.loads(texts[name])
+
+    tools = {}
+    for tool in ['check-couples.py', 'couples-practice.py', 'generator.py']:
+        try:
+            tools[tool] = load_tool(tool)
+        except Exception as e:
+            print('skipping {}: {!r}'.format(tool, e), file=sys.stderr)
+
+    if 'check-couples.py' in tools:
+        check_chart = tools['check-couples.py']['check_chart']
+
+        def check(simfile):
+            for chart in simfile.notes:
+                check_chart(chart, io.StringIO())
+
+        for name in ['double-16th', 'double-long-holds', 'marathon']:
+            notes = count_notes(parsed(name)())
+            yield ('check_chart', name, parsed(name), check, notes, 'notes')
+
+    if 'couples-practice.py' in tools:
+        generate_practice = tools['couples-practice.py']['generate_practice']
+
+        def practice(simfile):
+            for chart in simfile.notes:
+                generate_practice(chart.value, 'holds')
+                generate_practice(chart.value, 'rolls')
+
+        for name in ['double-long-holds', 'marathon']:
+            notes = count_notes(parsed(name)())
+            yield ('generate_practice', name, parsed(name), practice, notes,
+                   'notes')
+
+    for name in ['marathon', 'many-charts', 'double-long-holds']:
+        notes = count_notes(parsed(name)())
+        yield ('analyze_simfile', name, parsed(name),
+               pysm.analysis.analyze_simfile, notes, 'notes')
+
+    notes = count_notes(parsed('taps')())
+    yield ('short_rolls', 'taps', parsed('taps'),
+           lambda simfile: pysm.transforms.short_rolls(
+               *(chart.value for chart in simfile.notes)),
+           notes, 'notes')
+
+    if 'generator.py' in tools:
+        generate_from_template = tools['generator.py']['generate_from_template']
+
+        def template():
+            random.seed(0)
+            return parsed('template')().notes[0].value
+
+        notes = count_notes(parsed('template')())
+        yield ('generate_from_template', 'template', template,
+               generate_from_template, notes, 'notes')
+
+        generate_variants = tools['generator.py']['generate_variants']
+        yield ('generate_variants', 'template', template,
+               lambda t: generate_variants(t, 20, seed=0), 20, 'charts')
+
+        build_graph = tools['generator.py']['build_graph']
+        color_graph = tools['generator.py']['color_graph']
+        for name in ['template', 'long-template']:
+            def graph(name=name):
+                random.seed(0)
+                return build_graph(parsed(name)().notes[0].value)
+
+            yield ('color_graph', name, graph, color_graph,
+                   len(graph()), 'vertices')
+
+        generate_stream = tools['generator.py']['generate_stream']
+        for name in ['long-template', 'series-template']:
+            notes = count_notes(parsed(name)())
+            yield ('generate_stream', name,
+                   lambda name=name: parsed(name)().notes[0].value,
+                   lambda t: sum(1 for _ in generate_stream(
+                       t, rng=random.Random(0))),
+                   notes, 'notes')
+
+        double = tools['generator.py']['PADS']['dance-double']
+
+        def double_graph():
+            random.seed(0)
+            return build_graph(
+                parsed('long-template')().notes[0].value, pad=double)
+
+        yield ('color_graph-double', 'long-template', double_graph,
+               color_graph, len(double_graph()), 'vertices')
+
+
+def run_benchmark(setup, func, repeat):
+    best = None
+    for _ in range(repeat):
+        arg = setup()
+        start = time.perf_counter()
+        func(arg)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+
+    arg = setup()
+    tracemalloc.start()
+    func(arg)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True,
+            text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old_results, new_results):
+    old = {(r['name'], r['input']): r for r in old_results['results']}
+    for r in new_results['results']:
+        before = old.get((r['name'], r['input']))
+        if before is None:
+            continue
+        print('{:<24} {:<20} {:>9.4f}s -> {:>9.4f}s  x{:.2f}'.format(
+            r['name'], r['input'], before['seconds'], r['seconds'],
+            before['seconds'] / r['seconds'] if r['seconds'] else 0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '-o', '--output', help='write the results to this file')
+    parser.add_argument(
+        '-r', '--repeat', type=int, default=3,
+        help='runs per benchmark; the fastest is reported (default: 3)')
+    parser.add_argument(
+        '-k', '--filter', default='',
+        help='only run benchmarks whose name contains this')
+    parser.add_argument(
+        '--compare', metavar='FILE',
+        help='compare the timings with an earlier result file')
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        paths = corpus.write_corpus(directory)
+        for name, input_name, setup, func, amount, unit in benchmarks(paths):
+            if args.filter not in name:
+                continue
+            seconds, peak = run_benchmark(setup, func, args.repeat)
+            results.append({
+                'name': name,
+                'input': input_name,
+                'seconds': seconds,
+                'throughput': amount / seconds if seconds else None,
+                'unit': unit + '/s',
+                'peak_bytes': peak,
+            })
+            print('{:<24} {:<20} {:>9.4f}s {:>14.0f} {:<8} peak {:>8.0f} kB'
+                  .format(name, input_name, seconds,
+                          results[-1]['throughput'] or 0, unit + '/s',
+                          peak / 1024),
+                  file=sys.stderr)
+
+    output = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2)
+            f.write('\n')
+    else:
+        json.dump(output, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""Index the charts of a pack in an sqlite database and query it.
+
+`update` adds and refreshes the simfiles under the given paths, parsing
+only files whose size or mtime changed, and forgets files that no longer
+exist. `query` lists the matching charts without reading any simfiles.
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import urllib.request
+import pysm
+import pysm.analysis
+import pysm.batch
+import pysm.instrument
+import pysm.timing
+
+
+VERSION = 2
+
+SCHEMA = [
+    'CREATE TABLE files ('
+    ' path TEXT PRIMARY KEY,'
+    ' size INTEGER NOT NULL,'
+    ' mtime_ns INTEGER NOT NULL,'
+    ' title TEXT,'
+    ' artist TEXT,'
+    ' min_bpm REAL,'
+    ' max_bpm REAL)',
+    'CREATE TABLE charts ('
+    ' path TEXT NOT NULL REFERENCES files (path) ON DELETE CASCADE,'
+    ' number INTEGER NOT NULL,'
+    ' game TEXT NOT NULL,'
+    ' credit TEXT NOT NULL,'
+    ' level TEXT NOT NULL,'
+    ' feet INTEGER,'
+    ' groove TEXT NOT NULL,'
+    ' measures INTEGER NOT NULL,'
+    ' notes INTEGER NOT NULL,'
+    ' holds INTEGER NOT NULL,'
+    ' rolls INTEGER NOT NULL,'
+    ' mines INTEGER NOT NULL,'
+    ' jumps INTEGER NOT NULL,'
+    ' hands INTEGER NOT NULL,'
+    ' stream_measures INTEGER NOT NULL,'
+    ' crossovers INTEGER NOT NULL,'
+    ' duration REAL,'
+    ' average_nps REAL,'
+    ' peak_nps REAL,'
+    ' hold_coverage REAL,'
+    ' PRIMARY KEY (path, number))',
+    'CREATE INDEX charts_game_feet ON charts (game COLLATE NOCASE, feet)',
+    'CREATE INDEX charts_credit ON charts (credit COLLATE NOCASE)',
+]
+
+COLUMNS = [
+    'path', 'number', 'game', 'credit', 'level', 'feet', 'groove',
+    'measures', 'notes', 'holds', 'rolls', 'mines', 'jumps', 'hands',
+    'stream_measures', 'crossovers', 'min_bpm', 'max_bpm', 'duration',
+    'average_nps', 'peak_nps', 'hold_coverage',
+]
+
+
+def connect(path):
+    """Open the index at `path`, creating it or rebuilding it if it was
+    made by another version."""
+    db = sqlite3.connect(path)
+    db.execute('PRAGMA foreign_keys = ON')
+    if db.execute('PRAGMA user_version').fetchone()[0] != VERSION:
+        with db:
+            db.execute('DROP TABLE IF EXISTS charts')
+            db.execute('DROP TABLE IF EXISTS files')
+            for statement in SCHEMA:
+                db.execute(statement)
+            db.execute('PRAGMA user_version = {}'.format(VERSION))
+    return db
+
+
+def open_index(path):
+    """Open the index at `path` read-only.
+
+    Raises ValueError if there is no index there or it was made by
+    another version.
+    """
+    uri = 'file:{}?mode=ro'.format(
+        urllib.request.pathname2url(os.path.abspath(path)))
+    try:
+        db = sqlite3.connect(uri, uri=True)
+        version = db.execute('PRAGMA user_version').fetchone()[0]
+    except sqlite3.Error:
+        raise ValueError('no index, run update first')
+    if version != VERSION:
+        db.close()
+        raise ValueError('index made by another version, run update to '
+                         'rebuild it')
+    return db
+
+
+def _feet(chart):
+    try:
+        return int(chart.feet)
+    except ValueError:
+        return None
+
+
+def index_file(path):
+    """Return the `files` row and the `charts` rows of a simfile."""
+    st = os.stat(path)
+    simfile = pysm.load_path(path)
+
+    try:
+        timing = pysm.timing.TimingData.from_simfile(simfile)
+    except ValueError:
+        timing = None
+
+    min_bpm = max_bpm = None
+    if simfile.bpms is not None and isinstance(simfile.bpms.value, pysm.Bpms):
+        bpms = [bpm for _, bpm in simfile.bpms.value.speeds]
+        min_bpm, max_bpm = min(bpms), max(bpms)
+
+    def text(header):
+        return header.value.strip() if header is not None else None
+
+    path = os.path.abspath(path)
+    charts = []
+    for number, chart in enumerate(simfile.notes):
+        chart = chart.value
+        with pysm.instrument.phase('transform'):
+            stats = pysm.analysis.analyze(chart, timing)
+        charts.append((
+            path, number, chart.game, chart.credit, chart.level,
+            _feet(chart), chart.groove, len(chart.measures), stats.steps,
+            stats.holds, stats.rolls, stats.mines, stats.jumps, stats.hands,
+            stats.stream_measures, stats.crossovers, stats.last,
+            stats.average_nps, stats.peak_nps, stats.hold_coverage))
+
+    return ((path, st.st_size, st.st_mtime_ns, text(simfile.title),
+             text(simfile.artist), min_bpm, max_bpm), charts)
+
+
+def _changed(db, paths):
+    known = dict(
+        (path, (size, mtime_ns))
+        for path, size, mtime_ns in db.execute(
+            'SELECT path, size, mtime_ns FROM files'))
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        if known.get(os.path.abspath(path)) != (st.st_size, st.st_mtime_ns):
+            yield path
+
+
+def update(args):
+    pysm.batch.configure(args)
+    db = connect(args.index)
+
+    with db:
+        gone = [
+            path for path, in db.execute('SELECT path FROM files')
+            if not os.path.exists(path)
+        ]
+        db.executemany('DELETE FROM files WHERE path = ?',
+                       [(path,) for path in gone])
+
+    paths = list(_changed(db, pysm.batch.find_simfiles(args.paths)))
+
+    status = 0
+    stats = []
+    # One transaction, so that a large update is not one sync per file.
+    with db:
+        for result in pysm.batch.run(paths, index_file, args.jobs):
+            if result.stats is not None:
+                stats.append(result.stats)
+                if pysm.instrument.mode == 'json':
+                    pysm.instrument.report(result.stats, path=result.path)
+
+            if result.error is not None:
+                status = 1
+                print('{}: {}'.format(result.path, result.error),
+                      end='', file=sys.stderr)
+                continue
+
+            row, charts = result.value
+            db.execute('DELETE FROM files WHERE path = ?', (row[0],))
+            db.execute(
+                'INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?)', row)
+            db.executemany(
+                'INSERT INTO charts VALUES ({})'.format(
+                    ', '.join('?' * 20)), charts)
+
+    db.close()
+    pysm.batch.report(stats)
+    print('{} updated, {} removed'.format(len(paths), len(gone)),
+          file=sys.stderr)
+    return status
+
+
+def query(args):
+    where = []
+    params = []
+    for column in ['game', 'credit', 'level']:
+        value = getattr(args, column)
+        if value is not None:
+            where.append('charts.{} = ? COLLATE NOCASE'.format(column))
+            params.append(value)
+    if args.min_feet is not None:
+        where.append('feet >= ?')
+        params.append(args.min_feet)
+    if args.max_feet is not None:
+        where.append('feet <= ?')
+        params.append(args.max_feet)
+    for column in args.has:
+        where.append('{} > 0'.format(column))
+    if args.where:
+        where.append('({})'.format(args.where))
+
+    sql = 'SELECT {} FROM charts JOIN files USING (path)'.format(
+        ', '.join(COLUMNS))
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += ' ORDER BY path, number'
+
+    try:
+        db = open_index(args.index)
+    except ValueError as e:
+        print('{}: {}'.format(args.index, e), file=sys.stderr)
+        return 1
+    try:
+        rows = db.execute(sql, params).fetchall()
+    except sqlite3.Error as e:
+        print('{}: {}'.format(args.index, e), file=sys.stderr)
+        return 1
+    finally:
+        db.close()
+
+    if args.format == 'json':
+        for row in rows:
+            print(json.dumps(dict(zip(COLUMNS, row))))
+    else:
+        for row in rows:
+            print('\t'.join('' if value is None else str(value)
+                            for value in row))
+    return 0
+
+
+def add_index_argument(parser):
+    parser.add_argument(
+        '--index', default='charts.db', metavar='FILE',
+        help='the sqlite database (default: charts.db)')
+
+
+def argument_parser():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    update_parser = pysm.batch.argument_parser()
+    add_index_argument(update_parser)
+    commands.add_parser(
+        'update', parents=[update_parser], add_help=False,
+        help='add or refresh the simfiles under the given paths')
+
+    query_parser = commands.add_parser(
+        'query', help='print the matching charts, one per line')
+    query_parser.add_argument('--game', help='e.g. dance-double')
+    query_parser.add_argument('--credit')
+    query_parser.add_argument('--level', help='e.g. Challenge')
+    query_parser.add_argument(
+        '--min-feet', type=int, metavar='N', help='numeric level at least N')
+    query_parser.add_argument(
+        '--max-feet', type=int, metavar='N', help='numeric level at most N')
+    query_parser.add_argument(
+        '--has', action='append', default=[],
+        choices=['holds', 'rolls', 'mines', 'jumps', 'hands', 'crossovers'],
+        help='only charts with these notes; may be repeated')
+    query_parser.add_argument(
+        '--where', metavar='SQL',
+        help='any other condition on the columns, e.g. "max_bpm > 200"')
+    query_parser.add_argument(
+        '--format', choices=['tsv', 'json'], default='tsv',
+        help='tab-separated columns (default) or one JSON object per chart')
+    add_index_argument(query_parser)
+    return parser
+
+
+if __name__ == '__main__':
+    args = argument_parser().parse_args()
+    sys.exit(update(args) if args.command == 'update' else query(args))
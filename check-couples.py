@@ -1,7 +1,17 @@
 #!/usr/bin/env python3
 
+from collections import namedtuple
+import functools
+import io
+import json
 import sys
 import pysm
+import pysm.batch
+import pysm.instrument
+import pysm.timing
+
+
+Conflict = namedtuple('Conflict', ['measure', 'tick', 'column', 'seconds'])
 
 
 def get_arrow(note, col):
@@ -17,65 +27,130 @@ def get_arrow(note, col):
     }.get(note, ' ')
 
 
-def check_chart(chart):
-    holds = []
-    rolls = []
+def move_feet(feet, steps, mines):
+    """Update where a player's feet may be standing.
 
-    for measure_number, measure in enumerate(chart.value.measures):
-        errors = set()
-
-        for tick, row in enumerate(measure.notes):
-            def check_row(char, other):
-                for col, note in enumerate(row):
-                    if note == char:
-                        for notes in other:
-                            if col in notes:
-                                yield (tick, col)
-
-            def add_steps(char, player):
-                mines = {col for col, note in enumerate(row) if note == 'M'}
-                steps = {col for col, note in enumerate(row) if note == char}
-                if len(steps) > 1:
-                    player.clear()
-                    player.append(steps)
-                    player.append(set())
-                elif len(steps) == 1:
-                    if len(player) == 0 or player[-1] != steps:
-                        if len(player) > 1:
-                            player.pop(0)
-                        player.append(steps)
-
-                for foot in player:
-                    foot.difference_update(mines)
-
-            add_steps('2', holds)
-            add_steps('4', rolls)
-
-            errors.update(check_row('2', rolls))
-            errors.update(check_row('4', holds))
-
-        if len(errors) > 0:
-            print('--------- {0:^ 4} ---------'.format(measure_number))
-            measure = chart.value.measures[measure_number]
-            for tick in range(0, 192, measure.row_dist):
-                for col, note in enumerate(measure.notes[tick]):
-                    if (tick, col) in errors:
-                        fmt = '[{0}]'
-                    else:
-                        fmt = ' {0} '
-                    print(fmt.format(get_arrow(note, col)), end='')
-                print()
-            print()
+    `feet` holds up to two sets of columns, the latest last. A jump
+    replaces both; a single step onto a new arrow replaces the older
+    one. Mines clear the arrows they are on.
+    """
+    if len(steps) > 1:
+        feet[:] = [steps, set()]
+    elif len(steps) == 1 and (len(feet) == 0 or feet[-1] != steps):
+        if len(feet) > 1:
+            del feet[0]
+        feet.append(steps)
 
+    for foot in feet:
+        foot.difference_update(mines)
 
-if __name__ == '__main__':
-    with open(sys.argv[1], 'r') as f:
-        data = f.read()
 
-    simfile = pysm.loads(data)
+def find_conflicts(chart, timing=None):
+    """Find steps onto arrows the other player may still be standing on.
+
+    One player's steps are holds and the other's are rolls. Only rows
+    with holds, rolls or mines are looked at. Returns a list of
+    `Conflict`s in chart order; `seconds` is None without `timing`.
+    """
+    holds = []
+    rolls = []
+    conflicts = []
+    seen = 0
+
+    for measure_number, measure in enumerate(chart.measures):
+        for tick, row in measure.iter_rows():
+            if pysm.HOLD not in row and pysm.ROLL not in row \
+                    and pysm.MINE not in row:
+                continue
+
+            hold_steps = set()
+            roll_steps = set()
+            mines = set()
+            for col, note in enumerate(row):
+                if note == pysm.HOLD:
+                    hold_steps.add(col)
+                elif note == pysm.ROLL:
+                    roll_steps.add(col)
+                elif note == pysm.MINE:
+                    mines.add(col)
+
+            seen += len(hold_steps) + len(roll_steps) + len(mines)
+            move_feet(holds, hold_steps, mines)
+            move_feet(rolls, roll_steps, mines)
+
+            columns = {
+                col for col in hold_steps if any(col in f for f in rolls)
+            } | {
+                col for col in roll_steps if any(col in f for f in holds)
+            }
+            for col in sorted(columns):
+                seconds = None
+                if timing is not None:
+                    seconds = timing.seconds(measure_number * 192 + tick)
+                conflicts.append(Conflict(measure_number, tick, col, seconds))
+
+    pysm.instrument.count('notes seen', seen)
+    return conflicts
+
+
+def format_conflicts(chart, conflicts, file=sys.stdout):
+    """Print the measures with conflicts, marking the conflicting notes."""
+    errors = {}
+    for conflict in conflicts:
+        errors.setdefault(conflict.measure, set()).add(
+            (conflict.tick, conflict.column))
+
+    for measure_number in sorted(errors):
+        print('--------- {0:^ 4} ---------'.format(measure_number), file=file)
+        measure = chart.measures[measure_number]
+        for tick in range(0, 192, measure.row_dist):
+            for col, note in enumerate(measure.notes[tick]):
+                if (tick, col) in errors[measure_number]:
+                    fmt = '[{0}]'
+                else:
+                    fmt = ' {0} '
+                print(fmt.format(get_arrow(note, col)), end='', file=file)
+            print(file=file)
+        print(file=file)
+
+
+def check_chart(chart, file=sys.stdout):
+    format_conflicts(chart.value, find_conflicts(chart.value), file)
+
+
+def check_file(path, output_format='ascii'):
+    simfile = pysm.load_path(path)
     for h in simfile.headers:
         if h.name == pysm.Invalid:
             raise ValueError()
 
-    for chart in simfile.notes:
-        check_chart(chart)
+    try:
+        timing = pysm.timing.TimingData.from_simfile(simfile)
+    except ValueError:
+        timing = None
+
+    output = io.StringIO()
+    for number, chart in enumerate(simfile.notes):
+        with pysm.instrument.phase('transform'):
+            conflicts = find_conflicts(chart.value, timing)
+        if output_format == 'ascii':
+            format_conflicts(chart.value, conflicts, output)
+            continue
+
+        for conflict in conflicts:
+            record = dict(chart=number, **conflict._asdict())
+            print(json.dumps(record), file=output)
+    return output.getvalue()
+
+
+if __name__ == '__main__':
+    parser = pysm.batch.argument_parser(
+        'Check couples charts for steps onto arrows the other player '
+        'may still be standing on.')
+    parser.add_argument(
+        '--format', choices=['ascii', 'json'], default='ascii',
+        help='print marked measures (default) or one JSON object per '
+             'conflict')
+    args = parser.parse_args()
+    sys.exit(pysm.batch.main(
+        functools.partial(check_file, output_format=args.format), args))
@@ -2,21 +2,12 @@
 
 import sys
 import pysm
+import pysm.batch
+import pysm.instrument
 
 
-def get_row(chart, tick):
-    measure_number = tick // 192
-    try:
-        measure = chart.measures[measure_number]
-    except IndexError:
-        return None
-    return measure.notes[tick % 192]
-
-
-def irows(chart):
-    for measure in chart.measures:
-        for tick in range(192):
-            yield measure.notes[tick]
+# Bump when the generated charts change.
+VERSION = 1
 
 
 def generate_practice(template, player):
@@ -25,10 +16,7 @@ def generate_practice(template, player):
     else:
         to_mines = '2'
 
-    measures = [
-        pysm.Measure([list(t_row) for t_row in t_measure.notes])
-        for t_measure in template.measures
-    ]
+    measures = [t_measure.copy() for t_measure in template.measures]
     result = pysm.Notes(
         'dance-double',
         'Practice ({})'.format(player[0].upper() + player[1:]),
@@ -37,28 +25,19 @@ def generate_practice(template, player):
         template.groove,
         measures)
 
-    for tick, row in enumerate(irows(template)):
-        for col, note in enumerate(row):
-            if note != to_mines:
-                continue
-
-            get_row(result, tick)[col] = 'M'
+    for span in template.spans:
+        if span.type != to_mines:
+            continue
 
-            tail = 0
-            while get_row(result, tick + tail)[col] != '3':
-                if tail > 0 and tail % 48 == 0:
-                    get_row(result, tick + tail)[col] = 'M'
-                tail += 1
-            get_row(result, tick + tail)[col] = '0'
+        for tick in range(span.start, span.end, 48):
+            measures[tick // 192].notes[tick % 192][span.column] = 'M'
+        measures[span.end // 192].notes[span.end % 192][span.column] = '0'
 
     return result
 
 
-if __name__ == '__main__':
-    with open(sys.argv[1], 'r') as f:
-        data = f.read()
-
-    simfile = pysm.loads(data)
+def practice_file(path):
+    simfile = pysm.load_path(path, lazy=True)
     for h in simfile.headers:
         if h.name == pysm.Invalid:
             raise ValueError()
@@ -72,13 +51,18 @@ if __name__ == '__main__':
             simfile.headers.remove(chart)
 
         else:
-            simfile.headers.append(pysm.Header('NOTES',
-                generate_practice(chart.value, 'holds')
-            ))
-            simfile.headers.append(pysm.Header('NOTES',
-                generate_practice(chart.value, 'rolls')
-            ))
-
-    new_data = str(simfile)
-    with open(sys.argv[1], 'w') as f:
-        f.write(new_data)
+            with pysm.instrument.phase('transform'):
+                holds = generate_practice(chart.value, 'holds')
+                rolls = generate_practice(chart.value, 'rolls')
+            simfile.headers.append(pysm.Header('NOTES', holds))
+            simfile.headers.append(pysm.Header('NOTES', rolls))
+
+    pysm.batch.rewrite(path, simfile)
+
+
+if __name__ == '__main__':
+    parser = pysm.batch.argument_parser(
+        'Generate P1 and P2 practice versions of couples charts.',
+        cache=True)
+    sys.exit(pysm.batch.main(
+        practice_file, parser.parse_args(), ('couples-practice', VERSION)))
@@ -1,148 +1,431 @@
 #!/usr/bin/env python3
 
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import array
+import functools
 import sys
+import time
 import pysm
+import pysm.batch
+import pysm.instrument
+import pysm.heap
 import random
 import enum
-import heapq
-from heapdict import heapdict
+
+
+# Bump when the generated charts change.
+VERSION = 2
 
 
 class Vertex:
+    """An arrow of the chart while the graph is being built."""
+
+    __slots__ = ('note', 'ticks', 'color', 'hard_edges', 'soft_edges')
+
     def __init__(self, note=-1, tick=None):
         self.note = note
         self.ticks = []
         if tick is not None:
             self.ticks.append(tick)
-        self._color = None
+        self.color = None
         self.hard_edges = set()
         self.soft_edges = dict()
-        self.available = {0, 1, 2, 3}
 
     def connect(self, other, weight=0):
         if weight == 0:
-            try:
-                del self.soft_edges[other]
-                del other.soft_edges[self]
-            except KeyError:
-                pass
+            self.soft_edges.pop(other, None)
+            other.soft_edges.pop(self, None)
             self.hard_edges.add(other)
             other.hard_edges.add(self)
 
-            self.available.discard(other.color)
-            other.available.discard(self.color)
-
         elif other not in self.hard_edges:
             self.soft_edges[other] = weight
             other.soft_edges[self] = weight
 
-    @property
-    def color(self):
-        return self._color
-
-    @color.setter
-    def color(self, color):
-        if color is None:
-            self._color = None
-            self.update()
-            for v in self.hard_edges:
-                v.update()
-        else:
-            self._color = color
-            for other in self.hard_edges:
-                other.available.discard(color)
-
-    def update(self):
-        self.available = {0, 1, 2, 3}
-        for v in self.hard_edges:
-            self.available.discard(v.color)
-
-
-def n_entropy(vertex):
-    return -(len(vertex.hard_edges) - (4 ** len(vertex.available)))
-
 
-def choose(options):
-    draw = random.random() * sum(options.values())
+class Graph:
+    """The coloring problem of a template in compact form.
+
+    Vertices are numbered in the order they are given; edges to other
+    vertices are left out. The hard neighbors of vertex `i` are
+    `hard[hard_start[i]:hard_start[i+1]]`, and likewise for the soft
+    neighbors and their `soft_weights` and for the `ticks` of its notes.
+    `color[i]` is -1 while the vertex has no color, and bit `c` of
+    `domain[i]` is set while no hard neighbor has color `c`.
+    """
+
+    def __init__(self, vertices, colors=4):
+        super().__init__()
+        index = {v: i for i, v in enumerate(vertices)}
+        self.colors = colors
+        self.full = (1 << colors) - 1
+        self.notes = array.array('b', (v.note for v in vertices))
+
+        self.tick_start = array.array('l', [0])
+        self.ticks = array.array('l')
+        self.hard_start = array.array('l', [0])
+        self.hard = array.array('l')
+        self.soft_start = array.array('l', [0])
+        self.soft = array.array('l')
+        self.soft_weights = array.array('d')
+        for i, v in enumerate(vertices):
+            self.ticks.extend(v.ticks)
+            self.tick_start.append(len(self.ticks))
+            self.hard.extend(sorted(
+                index[u] for u in v.hard_edges if u is not v and u in index))
+            self.hard_start.append(len(self.hard))
+            for u, weight in v.soft_edges.items():
+                if u in index:
+                    self.soft.append(index[u])
+                    self.soft_weights.append(weight)
+            self.soft_start.append(len(self.soft))
+
+        self._bits = [bin(m).count('1') for m in range(self.full + 1)]
+        self.fixed = [
+            (i, v.color) for i, v in enumerate(vertices) if v.color is not None
+        ]
+        self.reset()
+
+    def reset(self):
+        """Clear all colors except those fixed when the graph was built."""
+        self.color = [-1] * len(self.notes)
+        self.domain = [self.full] * len(self.notes)
+        # How many hard neighbors have each color, `colors` per vertex.
+        self._blocked = array.array('l', [0]) * (len(self.notes) * self.colors)
+        for i, color in self.fixed:
+            self.assign(i, color)
+
+    def __len__(self):
+        return len(self.color)
+
+    def neighbors(self, i):
+        return self.hard[self.hard_start[i]:self.hard_start[i + 1]]
+
+    def ticks_of(self, i):
+        return self.ticks[self.tick_start[i]:self.tick_start[i + 1]]
+
+    def assign(self, i, color):
+        if self.color[i] >= 0:
+            self.unassign(i)
+        self.color[i] = color
+
+        bit = 1 << color
+        blocked = self._blocked
+        colors = self.colors
+        domain = self.domain
+        for j in self.neighbors(i):
+            k = j * colors + color
+            blocked[k] += 1
+            if blocked[k] == 1:
+                domain[j] &= ~bit
+
+    def unassign(self, i):
+        color = self.color[i]
+        if color < 0:
+            return
+        self.color[i] = -1
+
+        bit = 1 << color
+        blocked = self._blocked
+        colors = self.colors
+        domain = self.domain
+        for j in self.neighbors(i):
+            k = j * colors + color
+            blocked[k] -= 1
+            if blocked[k] == 0:
+                domain[j] |= bit
+
+    def entropy(self, i):
+        degree = self.hard_start[i + 1] - self.hard_start[i]
+        return 4 ** self._bits[self.domain[i]] - degree
+
+    def options(self, i, available):
+        """Return the weight of each color in `available` for vertex `i`.
+
+        Colors used by soft neighbors are less likely.
+        """
+        weights = [1] * self.colors
+        color = self.color
+        for k in range(self.soft_start[i], self.soft_start[i + 1]):
+            c = color[self.soft[k]]
+            if c >= 0:
+                weights[c] *= self.soft_weights[k]
+        return {
+            c: weights[c] for c in range(self.colors) if available >> c & 1
+        }
+
+
+def choose(options, rng=random):
+    draw = rng.random() * sum(options.values())
     for o, w in options.items():
         if draw <= w:
             return o
         draw -= w
 
 
-def color_graph_helper(graph):
-    stack = []
-    vertex, old_entropy = graph.popitem()
-    stack.append((vertex, old_entropy, set(vertex.available)))
-
-    while len(stack) > 0:
-        vertex, old_entropy, available = stack.pop()
-
-        if len(available) > 0:
-            options = {}
-            for color in available:
-                weight = 1
-                for (v, w) in vertex.soft_edges.items():
-                    if v.color == color:
-                        weight *= w
-                options[color] = weight
-            vertex.color = choose(options)
-            assert vertex.color is not None
-            for v in vertex.hard_edges:
-                if v.color is None:
-                    graph[v] = n_entropy(v)
-
-            available.discard(vertex.color)
-            stack.append((vertex, old_entropy, available))
-
-            if len(graph) == 0:
-                break
-
-            vertex, old_entropy = graph.popitem()
-            stack.append((vertex, old_entropy, set(vertex.available)))
-
-        else:
-            vertex.color = None
-            for v in vertex.hard_edges:
-                if v.color is None:
-                    graph[v] = n_entropy(v)
-            graph[vertex] = old_entropy
-
-    if len(graph) > 0:
-        raise ValueError
-
-
-def color_graph(graph):
-    changed = True
-    while changed:
-        changed = False
-        for v in graph:
-            if v.color is not None:
+class ColoringError(ValueError):
+    """A template graph could not be colored.
+
+    `ticks` are the ticks of the notes in the conflict that ended the
+    search. `reason` is `'conflict'` if the template has no coloring at
+    all, or `'budget'` if the search ran out of nodes or time first.
+    """
+
+    def __init__(self, message, ticks=(), reason='conflict'):
+        super().__init__(message)
+        self.ticks = sorted(set(ticks))
+        self.reason = reason
+
+
+class _Choice:
+    __slots__ = ('vertex', 'available', 'conflicts', 'trail_start')
+
+    def __init__(self, vertex, available, trail_start):
+        self.vertex = vertex
+        self.available = available
+        # Levels of the choices that made colors fail, created when the
+        # first one does.
+        self.conflicts = None
+        self.trail_start = trail_start
+
+    def blame(self, levels):
+        if self.conflicts is None:
+            self.conflicts = set()
+        self.conflicts.update(levels)
+
+
+class Solver:
+    """Colors a `Graph` by search with propagation and backjumping.
+
+    The vertex with the lowest entropy is colored next. After every
+    assignment, vertices left with a single color get it right away,
+    which for "different color" constraints is arc consistency, and a
+    vertex without colors is a conflict. A conflict is traced back
+    through the forced colors to the choices that caused it, and the
+    search jumps back to the latest of them.
+
+    `max_nodes` limits the number of colors tried and `max_seconds` the
+    search time; `solve()` raises `ColoringError` when it gives up.
+    Colors are drawn from `rng`, by default the `random` module.
+    """
+
+    def __init__(self, graph, max_nodes=None, max_seconds=None, rng=random):
+        super().__init__()
+        self.graph = graph
+        self.max_nodes = max_nodes
+        self.max_seconds = max_seconds
+        self.rng = rng
+        self.nodes = 0
+        self.backjumps = 0
+        # The choice level each colored vertex was colored at, 0 for
+        # colors that follow from the graph alone, where in the trail it
+        # was colored, and whether it was a choice or forced.
+        self._level = array.array('l', [0]) * len(graph)
+        self._order = array.array('l', [0]) * len(graph)
+        self._chosen = bytearray(len(graph))
+        self._trail = []
+        self._heap = pysm.heap.IndexedHeap()
+        self._conflict = None
+
+    def solve(self):
+        graph = self.graph
+        heap = self._heap
+        deadline = None
+        if self.max_seconds is not None:
+            deadline = time.perf_counter() + self.max_seconds
+
+        forced = []
+        for v in range(len(graph)):
+            if graph.color[v] >= 0:
                 continue
-            if len(v.available) == 0:
-                raise TypeError('No colors left')
-            if len(v.available) == 1:
-                v.color = list(v.available)[0]
-                changed = True
-
-    heap = heapdict()
-    for v in graph:
-        if v.color is None:
-            heap[v] = n_entropy(v)
+            domain = graph.domain[v]
+            if domain & (domain - 1) == 0:
+                forced.append(v)
+            else:
+                heap[v] = graph.entropy(v)
+        for v in forced:
+            if graph.color[v] < 0 and self._force(v, 0) is not None:
+                raise self._failure()
+
+        choices = []
+        while len(heap) > 0:
+            if self.max_nodes is not None and self.nodes >= self.max_nodes \
+                    or deadline is not None and time.perf_counter() > deadline:
+                self._conflict = choices[-1].vertex if choices else None
+                raise self._failure(
+                    'gave up after trying {} colors'.format(self.nodes),
+                    'budget')
+
+            vertex = heap.peekitem()[0]
+            choices.append(_Choice(
+                vertex, graph.domain[vertex], len(self._trail)))
+
+            while True:
+                choice = choices[-1]
+                level = len(choices)
+                if choice.available == 0:
+                    # Every color failed, because of the earlier choices
+                    # in `conflicts` and those that ruled out the other
+                    # colors.
+                    choice.blame(self._explain(choice.vertex))
+                    self._conflict = choice.vertex
+                    choices.pop()
+                    if not self._backjump(choices, choice.conflicts):
+                        raise self._failure()
+                    continue
+
+                color = choose(
+                    graph.options(choice.vertex, choice.available), self.rng)
+                choice.available &= ~(1 << color)
+                self.nodes += 1
+                self._set(choice.vertex, color, level, True)
+                conflicts = self._propagate(choice.vertex, level)
+                if conflicts is None:
+                    break
+
+                self._undo(choice.trail_start)
+                if level in conflicts:
+                    conflicts.discard(level)
+                    choice.blame(conflicts)
+                else:
+                    choices.pop()
+                    if not self._backjump(choices, conflicts):
+                        raise self._failure()
+
+        pysm.instrument.count('choices', self.nodes)
+        pysm.instrument.count('backjumps', self.backjumps)
+
+    def _backjump(self, choices, conflicts):
+        """Undo up to the latest choice in `conflicts`, if there is one."""
+        if not conflicts:
+            return False
+
+        self.backjumps += 1
+        level = max(conflicts)
+        del choices[level:]
+        choice = choices[-1]
+        self._undo(choice.trail_start)
+        conflicts.discard(level)
+        choice.blame(conflicts)
+        return True
+
+    def _explain(self, vertex):
+        """Return the levels of the choices that ruled out colors of
+        `vertex`.
+
+        Forced colors are followed back to the neighbors colored before
+        them, which left them a single color.
+        """
+        graph = self.graph
+        color = graph.color
+        level = self._level
+        order = self._order
+        levels = set()
+        seen = {vertex}
+        stack = [vertex]
+        while stack:
+            u = stack.pop()
+            for v in graph.neighbors(u):
+                if color[v] < 0 or level[v] == 0 or v in seen:
+                    continue
+                if u != vertex and order[v] > order[u]:
+                    continue
+                seen.add(v)
+                if self._chosen[v]:
+                    levels.add(level[v])
+                else:
+                    stack.append(v)
+        return levels
+
+    def _set(self, vertex, color, level, chosen):
+        self.graph.assign(vertex, color)
+        self._level[vertex] = level
+        self._order[vertex] = len(self._trail)
+        self._chosen[vertex] = chosen
+        self._trail.append(vertex)
+        if vertex in self._heap:
+            del self._heap[vertex]
+
+    def _force(self, vertex, level):
+        domain = self.graph.domain[vertex]
+        if domain == 0:
+            self._conflict = vertex
+            return self._explain(vertex)
+        self._set(vertex, domain.bit_length() - 1, level, False)
+        return self._propagate(vertex, level)
+
+    def _propagate(self, vertex, level):
+        """Color the vertices left with one color after `vertex`.
+
+        Returns the levels of the choices causing a conflict, or None.
+        """
+        graph = self.graph
+        heap = self._heap
+        queue = [vertex]
+        while queue:
+            for v in graph.neighbors(queue.pop()):
+                if graph.color[v] >= 0:
+                    continue
+                domain = graph.domain[v]
+                if domain == 0:
+                    self._conflict = v
+                    return self._explain(v)
+                if domain & (domain - 1) == 0:
+                    self._set(v, domain.bit_length() - 1, level, False)
+                    queue.append(v)
+                else:
+                    heap[v] = graph.entropy(v)
+        return None
 
-    color_graph_helper(heap)
+    def _undo(self, trail_start):
+        graph = self.graph
+        heap = self._heap
+        trail = self._trail
+        while len(trail) > trail_start:
+            vertex = trail.pop()
+            graph.unassign(vertex)
+            heap[vertex] = graph.entropy(vertex)
+            for v in graph.neighbors(vertex):
+                if graph.color[v] < 0:
+                    heap[v] = graph.entropy(v)
+
+    def _failure(self, message=None, reason='conflict'):
+        graph = self.graph
+        vertex = self._conflict
+        ticks = []
+        if vertex is not None:
+            for v in [vertex] + list(graph.neighbors(vertex)):
+                if graph.notes[v] >= 0:
+                    ticks.extend(t for t in graph.ticks_of(v) if t >= 0)
+        if message is None:
+            message = 'no way to place the notes at ticks {}'.format(
+                ', '.join(str(t) for t in sorted(set(ticks))))
+        return ColoringError(message, ticks, reason)
+
+
+def color_graph(graph, max_nodes=None, max_seconds=None, rng=random):
+    """Color `graph` in place, or raise `ColoringError`."""
+    Solver(graph, max_nodes, max_seconds, rng).solve()
+
+
+def _color_variants(graph, seeds, max_nodes=None, max_seconds=None):
+    colorings = []
+    for seed in seeds:
+        graph.reset()
+        color_graph(graph, max_nodes, max_seconds, random.Random(seed))
+        colorings.append(list(graph.color))
+    return colorings
 
 
 def irows(measures):
-    tick = 0
-    for measure in measures:
-        for row in measure.notes:
-            try:
-                yield (tick, row)
-            except ValueError:
-                pass
-            finally:
-                tick += 1
+    """Yield `(tick, row)` for the rows of `measures` that have notes.
+
+    Rows are bytes of ASCII codes.
+    """
+    for number, measure in enumerate(measures):
+        for tick, row in measure.iter_rows():
+            yield (number * 192 + tick, row)
 
 
 def get_row(notes, tick):
@@ -154,76 +437,134 @@ def get_row(notes, tick):
     return measure.notes[tick % 192]
 
 
-def generate_from_template(template):
-    left  = Vertex()
-    right = Vertex()
-    up    = Vertex()
-    down  = Vertex()
-
-    left.color  = 0
-    up.color    = 1
-    down.color  = 2
-    right.color = 3
-
-    graph = [ left, right, up, down ]
-
-    foot = random.choice([0, 1])
-    sides = [left, right]
-    history = [[],[]]
-    prev = -1
-    series = [None] * 8
-    for tick, row in irows(template.measures):
-        mines = [i for i, x in enumerate(row) if x == 'M']
-        notes = [i for i, x in enumerate(row) if x in '124']
+Pad = namedtuple('Pad', ['game', 'columns', 'left', 'right'])
+Pad.__doc__ = """The arrows of a dance pad to generate charts for.
+
+`left` are the columns the right foot never steps on, except when
+crossing over, and `right` the same for the left foot. The first note
+is on one of them.
+"""
+
+PADS = {
+    'dance-single': Pad('dance-single', 4, (0,), (3,)),
+    'dance-double': Pad('dance-double', 8, (0, 1), (6, 7)),
+}
+
+_STEPS = (pysm.TAP, pysm.HOLD, pysm.ROLL)
+
+# Columns of templates with a special meaning; notes in the others are
+# series of the same arrow.
+_CROSSOVER = 0
+_WILDCARD = 7
+
+
+class _Builder:
+    """Turns the rows of a template into vertices, a row at a time.
+
+    `arrows` are the fixed vertices of the pad and `vertices` the others
+    in the order they were made. `notes` gets a `(tick, vertex)` pair
+    for every note.
+    """
+
+    def __init__(self, pad, foot, columns):
+        super().__init__()
+        if not pad.left or not pad.right or \
+                not all(0 <= c < pad.columns for c in pad.left + pad.right):
+            raise ValueError('invalid pad: {}'.format(pad))
+
+        self.pad = pad
+        self.arrows = []
+        for column in range(pad.columns):
+            arrow = Vertex()
+            arrow.color = column
+            self.arrows.append(arrow)
+        self.vertices = []
+        self.notes = []
+
+        self.foot = foot
+        self.sides = [pad.left, pad.right]
+        # The last vertex of each foot.
+        self.history = [None, None]
+        self.prev = -1
+        self.series = [None] * columns
+
+    def referenced(self, vertex, tick):
+        """Return whether rows from `tick` on may connect `vertex`."""
+        if vertex in self.history:
+            return True
+        # A series only goes on if its last note is recent enough.
+        return vertex in self.series and vertex.ticks[-1] >= tick - 96
+
+    def _only(self, columns, note):
+        # A vertex that must be one of `columns`.
+        if len(columns) == 1:
+            return self.arrows[columns[0]]
+        vertex = Vertex(note)
+        self.vertices.append(vertex)
+        self._avoid(
+            vertex, [c for c in range(self.pad.columns) if c not in columns])
+        return vertex
+
+    def _avoid(self, vertex, columns):
+        for column in columns:
+            vertex.connect(self.arrows[column])
+
+    def add_row(self, tick, row):
+        sides = self.sides
+        history = self.history
+        series = self.series
+        mines = [i for i, x in enumerate(row) if x == pysm.MINE]
+        notes = [i for i, x in enumerate(row) if x in _STEPS]
 
         for mine in mines:
             series[mine] = None
 
         for note in notes:
-
+            foot = self.foot
+            prev = self.prev
             vertex = None
 
             if prev < 0:
                 # first note
                 # always start with a left or right note
-                vertex = sides[foot]
-                if note != 7:
+                vertex = self._only(sides[foot], note)
+                if note != _WILDCARD:
                     series[note] = vertex
 
-            elif note != 7 and note == prev:
+            elif note != _WILDCARD and note == prev:
                 # double step
                 foot = 1 - foot
-                vertex = history[foot][-1]
+                vertex = history[foot]
 
-            elif note == 0:
+            elif note == _CROSSOVER:
                 # crossover
-                vertex = sides[1 - foot]
+                vertex = self._only(sides[1 - foot], note)
                 other = history[1 - foot]
-                if len(other) > 0:
-                    vertex.connect(other[-1])
+                if other is not None:
+                    vertex.connect(other)
 
-            elif prev == 0 and len(history[foot]) > 0:
+            elif prev == _CROSSOVER and history[foot] is not None:
                 # after crossover
-                vertex = history[foot][-1]
+                vertex = history[foot]
                 other = history[1 - foot]
-                if len(other) > 0:
-                    vertex.connect(other[-1])
+                if other is not None:
+                    vertex.connect(other)
 
-            elif note == 7:
+            elif note == _WILDCARD:
                 # wild card note
                 vertex = Vertex(note)
-                graph.append(vertex)
-                vertex.connect(sides[1 - foot])
+                self.vertices.append(vertex)
+                self._avoid(vertex, sides[1 - foot])
 
                 other = history[1 - foot]
-                if len(other) > 0:
-                    vertex.connect(other[-1])
+                if other is not None:
+                    vertex.connect(other)
 
-                if len(history[foot]) > 0:
-                    if history[foot][-1] in series:
-                        vertex.connect(history[foot][-1], 0)
+                if history[foot] is not None:
+                    if history[foot] in series:
+                        vertex.connect(history[foot], 0)
                     else:
-                        vertex.connect(history[foot][-1], 0.25)
+                        vertex.connect(history[foot], 0.25)
 
             else:
                 # part of a series
@@ -232,38 +573,230 @@ def generate_from_template(template):
                     vertex = series[note]
                 else:
                     vertex = Vertex(note)
-                    graph.append(vertex)
+                    self.vertices.append(vertex)
                     series[note] = vertex
 
-                vertex.connect(sides[1 - foot])
+                self._avoid(vertex, sides[1 - foot])
 
                 other = history[1 - foot]
-                if len(other) > 0:
-                    vertex.connect(other[-1])
-                if len(history[foot]) > 0 and \
-                        history[foot][-1] is not vertex:
-                    vertex.connect(history[foot][-1], 0)
+                if other is not None:
+                    vertex.connect(other)
+                if history[foot] is not None and \
+                        history[foot] is not vertex:
+                    vertex.connect(history[foot], 0)
 
             vertex.ticks.append(tick)
-            history[foot].append(vertex)
-            prev = note
-            foot = 1 - foot
-        # for note in notes
-    # for tick, row in irows
+            self.notes.append((tick, vertex))
+            history[foot] = vertex
+            self.prev = note
+            self.foot = 1 - foot
+
+
+def _template_columns(template):
+    return template.measures[0].columns if template.measures else 0
+
 
-    color_graph(graph)
+def build_graph(template, foot=None, pad=PADS['dance-single']):
+    """Return the `Graph` of the coloring problem for a template.
 
-    measures = [
-        pysm.Measure([['0'] * 4 for _ in range(192)])
-        for _ in template.measures
+    Each vertex is one arrow, pressed at the ticks of its notes; the
+    first `pad.columns` are the arrows of the pad, with fixed colors.
+    `foot` is the foot of the first note, 0 for left and 1 for right,
+    and random by default.
+    """
+    if foot is None:
+        foot = random.choice([0, 1])
+    builder = _Builder(pad, foot, _template_columns(template))
+    for tick, row in irows(template.measures):
+        builder.add_row(tick, row)
+    return Graph(builder.arrows + builder.vertices, pad.columns)
+
+
+def generate_stream(template, window=32, overlap=4, foot=None,
+                    pad=PADS['dance-single'], max_nodes=None,
+                    max_seconds=None, rng=random):
+    """Yield the measures of a chart for `pad` generated from a template.
+
+    The template is colored `window` measures at a time. The colors of
+    the notes in all but the last `overlap` measures of a window are
+    then fixed, those measures are yielded and the next window starts
+    after them. Arrows that later notes may still connect to, such as an
+    ongoing series, keep their color but stay in the graph, so that the
+    constraints of later notes still apply to them. Only the vertices
+    of the current window and those arrows are kept, so memory does not
+    grow with the length of the template.
+
+    Raises `ColoringError` if a window cannot be colored. Since earlier
+    windows are fixed, this can also happen for templates that could be
+    colored as a whole, more often with a small `overlap`.
+    """
+    if not 0 <= overlap < window:
+        raise ValueError('overlap must be less than the window')
+    if foot is None:
+        foot = rng.choice([0, 1])
+
+    builder = _Builder(pad, foot, _template_columns(template))
+    arrows = builder.arrows
+    columns = pad.columns
+    rows = irows(template.measures)
+    row = next(rows, None)
+    # Vertices without a fixed color yet.
+    pending = []
+
+    total = len(template.measures)
+    start = end = 0
+    while start < total:
+        end = min(max(start + window, end + window - overlap), total)
+        while row is not None and row[0] < end * 192:
+            builder.add_row(*row)
+            row = next(rows, None)
+        pending.extend(builder.vertices)
+        builder.vertices = []
+
+        graph = Graph(arrows + pending, columns)
+        pysm.instrument.count('graph vertices', len(graph))
+        color_graph(graph, max_nodes, max_seconds, rng)
+
+        boundary = end if end == total else end - overlap
+        later = []
+        pinned = {}
+        for i, vertex in enumerate(pending, len(arrows)):
+            if vertex.ticks[0] >= boundary * 192:
+                later.append(vertex)
+            elif end == total or not builder.referenced(vertex, end * 192):
+                vertex.color = graph.color[i]
+                _forget(vertex, arrows)
+            else:
+                pinned[vertex] = graph.color[i]
+                _pin(vertex, graph.color[i], arrows)
+                vertex.ticks = [
+                    tick for tick in vertex.ticks if tick >= boundary * 192
+                ] or vertex.ticks[-1:]
+                later.append(vertex)
+        pending = later
+
+        measures = [
+            bytearray(b'0' * columns * 192) for _ in range(start, boundary)
+        ]
+        notes = builder.notes
+        done = 0
+        while done < len(notes) and notes[done][0] < boundary * 192:
+            tick, vertex = notes[done]
+            color = pinned.get(vertex, vertex.color)
+            measures[tick // 192 - start][tick % 192 * columns
+                                          + color] = pysm.TAP
+            done += 1
+        del notes[:done]
+        for arrow in arrows:
+            del arrow.ticks[:-1]
+
+        for data in measures:
+            yield pysm.Measure.from_buffer(data, columns)
+        start = boundary
+
+
+def _pin(vertex, color, arrows):
+    # Leave `color` as the only color of a vertex that stays in the graph.
+    for arrow in arrows:
+        if arrow.color != color:
+            vertex.connect(arrow)
+
+
+def _forget(vertex, arrows):
+    # Replace the edges of a colored vertex with edges to the fixed
+    # arrow of its color, which constrain its neighbors the same way.
+    arrow = arrows[vertex.color]
+    for v in vertex.hard_edges:
+        v.hard_edges.discard(vertex)
+        if v.color is None:
+            v.connect(arrow)
+    for v, weight in vertex.soft_edges.items():
+        del v.soft_edges[vertex]
+        if v.color is None and arrow not in v.hard_edges:
+            weight *= v.soft_edges.get(arrow, 1)
+            v.connect(arrow, weight)
+    vertex.hard_edges = set()
+    vertex.soft_edges = dict()
+
+
+def generate_from_template(template, max_nodes=None, max_seconds=None,
+                           pad=PADS['dance-single']):
+    """Generate a chart for `pad` from a template.
+
+    Raises `ColoringError` if the notes cannot be placed, or could not
+    be placed within `max_nodes` or `max_seconds`.
+    """
+    graph = build_graph(template, pad=pad)
+    pysm.instrument.count('graph vertices', len(graph))
+    color_graph(graph, max_nodes, max_seconds)
+    return make_chart(template, graph, graph.color, pad.game)
+
+
+def generate_variants(template, count, seed=None, jobs=1, max_nodes=None,
+                      max_seconds=None, pad=PADS['dance-single']):
+    """Generate `count` charts for `pad` from a template.
+
+    The graph is built once for each starting foot and only colored
+    again for each chart. Chart `i` only depends on `seed` and `i`, so
+    the same seed gives the same charts, also with more `jobs`. With
+    more than one job, the colorings are spread over a process pool.
+    """
+    if seed is None:
+        seed = random.randrange(1 << 32)
+    seeds = ['{}:{}'.format(seed, i) for i in range(count)]
+    feet = [random.Random(s + ':foot').choice([0, 1]) for s in seeds]
+
+    groups = []
+    for foot in [0, 1]:
+        indices = [i for i in range(count) if feet[i] == foot]
+        if indices:
+            graph = build_graph(template, foot, pad)
+            pysm.instrument.count('graph vertices', len(graph))
+            groups.append((graph, indices))
+
+    colorings = [None] * count
+    if jobs <= 1:
+        for graph, indices in groups:
+            results = _color_variants(
+                graph, [seeds[i] for i in indices], max_nodes, max_seconds)
+            for i, coloring in zip(indices, results):
+                colorings[i] = (graph, coloring)
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = []
+            for graph, indices in groups:
+                for chunk in (indices[k::jobs] for k in range(jobs)):
+                    if chunk:
+                        futures.append((graph, chunk, executor.submit(
+                            _color_variants, graph, [seeds[i] for i in chunk],
+                            max_nodes, max_seconds)))
+            for graph, chunk, future in futures:
+                for i, coloring in zip(chunk, future.result()):
+                    colorings[i] = (graph, coloring)
+
+    return [
+        make_chart(template, graph, coloring, pad.game)
+        for graph, coloring in colorings
     ]
-    for vertex in graph:
-        for tick in vertex.ticks:
+
+
+def make_chart(template, graph, colors, game='dance-single'):
+    """Return the chart of a template with the arrows in `colors`."""
+    columns = graph.colors
+    measures = [bytearray(b'0' * columns * 192) for _ in template.measures]
+    for vertex, color in enumerate(colors):
+        for tick in graph.ticks_of(vertex):
             if tick >= 0:
-                measures[tick // 192].notes[tick % 192][vertex.color] = '1'
+                measures[tick // 192][tick % 192 * columns + color] = pysm.TAP
 
+    return _generated(
+        template, game,
+        [pysm.Measure.from_buffer(data, columns) for data in measures])
+
+
+def _generated(template, game, measures):
     return pysm.Notes(
-        'dance-single',
+        game,
         'generated',
         template.level,
         template.feet,
@@ -271,11 +804,9 @@ def generate_from_template(template):
         measures)
 
 
-if __name__ == '__main__':
-    with open(sys.argv[1], 'r') as f:
-        data = f.read()
-
-    simfile = pysm.loads(data)
+def generate_file(path, variants=1, seed=None, max_seconds=None,
+                  game='dance-single', window=None, jobs=1):
+    simfile = pysm.load_path(path, lazy=True)
     for h in simfile.headers:
         if h.name == pysm.Invalid:
             raise ValueError()
@@ -291,11 +822,69 @@ if __name__ == '__main__':
             simfile.headers.remove(chart)
 
     # Generate new charts.
-    for template in templates:
-        simfile.headers.append(pysm.Header('NOTES',
-            generate_from_template(template)
-        ))
-
-    new_data = str(simfile)
-    with open(sys.argv[1], 'w') as f:
-        f.write(new_data)
+    for number, template in enumerate(templates):
+        with pysm.instrument.phase('transform'):
+            if window is not None:
+                charts = []
+                for i in range(variants):
+                    rng = random
+                    if seed is not None:
+                        rng = random.Random('{}:{}:{}'.format(seed, number, i))
+                    charts.append(_generated(template, game, list(
+                        generate_stream(
+                            template, window, min(4, window - 1),
+                            pad=PADS[game], max_seconds=max_seconds,
+                            rng=rng))))
+            elif seed is None and variants == 1:
+                charts = [generate_from_template(
+                    template, max_seconds=max_seconds, pad=PADS[game])]
+            else:
+                charts = generate_variants(
+                    template, variants,
+                    None if seed is None else '{}:{}'.format(seed, number),
+                    jobs, max_seconds=max_seconds, pad=PADS[game])
+        for chart in charts:
+            simfile.headers.append(pysm.Header('NOTES', chart))
+
+    pysm.batch.rewrite(path, simfile)
+
+
+if __name__ == '__main__':
+    parser = pysm.batch.argument_parser(
+        'Generate charts from the template charts of simfiles.',
+        cache=True)
+    parser.add_argument(
+        '-n', '--variants', type=int, default=1,
+        help='number of charts to generate per template (default: 1)')
+    parser.add_argument(
+        '--seed',
+        help='random seed, to generate the same charts again')
+    parser.add_argument(
+        '--max-seconds', type=float,
+        help='give up on a chart after this many seconds')
+    parser.add_argument(
+        '--game', choices=sorted(PADS), default='dance-single',
+        help='game of the generated charts (default: dance-single)')
+    parser.add_argument(
+        '--window', type=int, metavar='MEASURES',
+        help='generate charts this many measures at a time, for very long '
+             'templates')
+    parser.add_argument(
+        '--variant-jobs', type=int, default=1, metavar='N',
+        help='worker processes coloring the variants of one template, '
+             'without --window (default: 1)')
+    args = parser.parse_args()
+    if args.window is not None and args.window < 1:
+        parser.error('--window must be at least 1')
+    if args.variant_jobs < 1:
+        parser.error('--variant-jobs must be at least 1')
+
+    # Runs with other output options must not skip files in the cache.
+    version = '{} variants={} seed={} game={} window={}'.format(
+        VERSION, args.variants, args.seed, args.game, args.window)
+    sys.exit(pysm.batch.main(
+        functools.partial(
+            generate_file, variants=args.variants, seed=args.seed,
+            max_seconds=args.max_seconds, game=args.game,
+            window=args.window, jobs=args.variant_jobs),
+        args, ('generator', version)))
@@ -1,138 +0,0 @@
-# Copyright 2009 Stutzbach Enterprises, LLC (daniel@stutzbachenterprises.com)
-#
-# Redistribution and use in source and binary forms, with or without
-# modification, are permitted provided that the following conditions are
-# met:
-#
-#    1. Redistributions of source code must retain the above copyright
-#       notice, this list of conditions and the following disclaimer.
-#    2. Redistributions in binary form must reproduce the above
-#       copyright notice, this list of conditions and the following
-#       disclaimer in the documentation and/or other materials provided
-#       with the distribution.
-#    3. The name of the author may not be used to endorse or promote
-#       products derived from this software without specific prior written
-#       permission.
-#
-# THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
-# IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
-# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
-# DISCLAIMED. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT,
-# INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
-# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
-# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
-# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT,
-# STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING
-# IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
-# POSSIBILITY OF SUCH DAMAGE.
-
-import collections
-
-def doc(s):
-    if hasattr(s, '__call__'):
-        s = s.__doc__
-    def f(g):
-        g.__doc__ = s
-        return g
-    return f
-
-class heapdict(collections.MutableMapping):
-    __marker = object()
-
-    @staticmethod
-    def _parent(i):
-        return ((i - 1) >> 1)
-
-    @staticmethod
-    def _left(i):
-        return ((i << 1) + 1)
-
-    @staticmethod
-    def _right(i):
-        return ((i+1) << 1)    
-    
-    def __init__(self, *args, **kw):
-        self.heap = []
-        self.d = {}
-        self.update(*args, **kw)
-
-    @doc(dict.clear)
-    def clear(self):
-        del self.heap[:]
-        self.d.clear()
-
-    @doc(dict.__setitem__)
-    def __setitem__(self, key, value):
-        if key in self.d:
-            self.pop(key)
-        wrapper = [value, key, len(self)]
-        self.d[key] = wrapper
-        self.heap.append(wrapper)
-        self._decrease_key(len(self.heap)-1)
-
-    def _min_heapify(self, i):
-        l = self._left(i)
-        r = self._right(i)
-        n = len(self.heap)
-        if l < n and self.heap[l][0] < self.heap[i][0]:
-            low = l
-        else:
-            low = i
-        if r < n and self.heap[r][0] < self.heap[low][0]:
-            low = r
-
-        if low != i:
-            self._swap(i, low)
-            self._min_heapify(low)
-
-    def _decrease_key(self, i):
-        while i:
-            parent = self._parent(i)
-            if self.heap[parent][0] < self.heap[i][0]: break
-            self._swap(i, parent)
-            i = parent
-
-    def _swap(self, i, j):
-        self.heap[i], self.heap[j] = self.heap[j], self.heap[i]
-        self.heap[i][2] = i
-        self.heap[j][2] = j
-
-    @doc(dict.__delitem__)
-    def __delitem__(self, key):
-        wrapper = self.d[key]
-        while wrapper[2]:
-            parentpos = self._parent(wrapper[2])
-            parent = self.heap[parentpos]
-            self._swap(wrapper[2], parent[2])
-        self.popitem()
-
-    @doc(dict.__getitem__)
-    def __getitem__(self, key):
-        return self.d[key][0]
-
-    @doc(dict.__iter__)
-    def __iter__(self):
-        return iter(self.d)
-
-    def popitem(self):
-        """D.popitem() -> (k, v), remove and return the (key, value) pair with lowest\nvalue; but raise KeyError if D is empty."""
-        wrapper = self.heap[0]
-        if len(self.heap) == 1:
-            self.heap.pop()
-        else:
-            self.heap[0] = self.heap.pop(-1)
-            self.heap[0][2] = 0
-            self._min_heapify(0)
-        del self.d[wrapper[1]]
-        return wrapper[1], wrapper[0]    
-
-    @doc(dict.__len__)
-    def __len__(self):
-        return len(self.d)
-
-    def peekitem(self):
-        """D.peekitem() -> (k, v), return the (key, value) pair with lowest value;\n but raise KeyError if D is empty."""
-        return (self.heap[0][1], self.heap[0][0])
-
-del doc
-__all__ = ['heapdict']
@@ -1,68 +1,39 @@
 #!/usr/bin/env python3
 
+import functools
 import sys
 import pysm
+import pysm.batch
+import pysm.instrument
+import pysm.transforms
 
 
-def get_row(notes, tick):
-    measure_number = tick // 192
-    try:
-        measure = notes.value.measures[measure_number]
-    except IndexError:
-        return None
-    return measure.notes[tick % 192]
-
-
-def irows(notes):
-    for measure in notes.value.measures:
-        for tick in range(192):
-            yield measure.notes[tick]
-
-
-def fix_chart(chart):
-    for tick, row in enumerate(irows(chart)):
-        for col, note in enumerate(row):
-            if note != '1':
-                continue
-
-            row[col] = '4'
-
-            next_note = 0
-            for i in range(1, 16):
-                next_row = get_row(chart, tick + i)
-                if next_row is None or next_row[col] != '0':
-                    next_note = i
-                    break
-            else:
-                next_note = 16
+def fix_file(path, in_place=False):
+    simfile = pysm.load_path(path)
+    for h in simfile.headers:
+        if h.name == pysm.Invalid:
+            raise ValueError()
 
-            assert next_note >= 2
+    with pysm.instrument.phase('transform'):
+        pysm.transforms.short_rolls(
+            *(chart.value for chart in simfile.notes))
 
-            if next_note >= 16:
-                tail = 12
-            elif next_note >= 10:
-                tail = 6
-            elif next_note >= 8:
-                tail = 4
-            elif next_note >= 6:
-                tail = 3
-            elif next_note >= 4:
-                tail = 2
-            else:
-                tail = 1
+    if not in_place:
+        with pysm.instrument.phase('serialize'):
+            return str(simfile)
 
-            get_row(chart, tick + tail)[col] = '3'
+    pysm.batch.rewrite(path, simfile)
 
 
 if __name__ == '__main__':
-    with open(sys.argv[1], 'r') as f:
-        data = f.read()
-
-    simfile = pysm.loads(data)
-    for h in simfile.headers:
-        if h.name == pysm.Invalid:
-            raise ValueError()
-
-    for chart in simfile.notes:
-        fix_chart(chart)
-    print(simfile, end='')
+    parser = pysm.batch.argument_parser(
+        'Convert all normal notes to short roll notes.')
+    parser.add_argument(
+        '-i', '--in-place', action='store_true',
+        help='rewrite the files instead of printing the result')
+    args = parser.parse_args()
+    if not args.in_place and len(pysm.batch.find_simfiles(args.paths)) > 1:
+        parser.error('more than one file requires --in-place')
+
+    sys.exit(pysm.batch.main(
+        functools.partial(fix_file, in_place=args.in_place), args))
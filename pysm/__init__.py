@@ -1,14 +1,61 @@
 from collections import namedtuple
 import math
+import mmap
+import os
 import re
 import sys
+import tempfile
+import time
 import traceback
 
+from pysm import binary
+from pysm import instrument
+
 
 class ParseError(ValueError):
     pass
 
 
+Token = namedtuple('Token', ['kind', 'start', 'end'])
+
+Span = namedtuple('Span', ['start', 'end', 'column', 'type'])
+
+HEADER = 'header'
+COMMENT = 'comment'
+MEASURE = 'measure'
+
+Syntax = namedtuple('Syntax', [
+    'hash', 'colon', 'semicolon', 'newline', 'comment', 'empty',
+    'measure_end_re', 'note_row_re', 'columns_re',
+])
+
+_TEXT_SYNTAX = Syntax(
+    '#', ':', ';', '\n', '//', '',
+    re.compile(r'//[^\n]*|(,)'),
+    re.compile(r'//[^\n]*|([^\s/]+|/)'),
+    re.compile(r'^\s*(\d+)\s*$', re.MULTILINE),
+)
+
+_BINARY_SYNTAX = Syntax(
+    b'#', b':', b';', b'\n', b'//', b'',
+    re.compile(rb'//[^\n]*|(,)'),
+    re.compile(rb'//[^\n]*|([^\s/]+|/)'),
+    re.compile(rb'^\s*(\d+)\s*$', re.MULTILINE),
+)
+
+
+def _syntax(data):
+    if isinstance(data, str):
+        return _TEXT_SYNTAX
+    return _BINARY_SYNTAX
+
+
+def _text(data):
+    if isinstance(data, str):
+        return data
+    return str(data, 'utf-8')
+
+
 class Header:
     def __init__(self, name, value):
         super().__init__()
@@ -16,7 +63,16 @@ class Header:
         self.value = value
 
     def __str__(self):
-        return '#' + self.name + ':' + str(self.value) + ';'
+        return ''.join(self.chunks())
+
+    def chunks(self):
+        """Yield the text of the header in pieces."""
+        yield '#' + self.name + ':'
+        if isinstance(self.value, Notes):
+            yield from self.value.chunks()
+        else:
+            yield str(self.value)
+        yield ';'
 
     def __repr__(self):
         return '{}(name={}, value={})'.format(
@@ -33,6 +89,9 @@ class Comment(Header):
     def __str__(self):
         return self.value
 
+    def chunks(self):
+        yield self.value
+
 
 class Invalid(Header):
     def __init__(self, data):
@@ -41,20 +100,88 @@ class Invalid(Header):
     def __str__(self):
         return self.value
 
+    def chunks(self):
+        yield self.value
+
+
+class TrackedList(list):
+    """A list that calls `on_change` before every modification."""
+
+    def __init__(self, items, on_change):
+        super().__init__(items)
+        self._on_change = on_change
+
+    def __setitem__(self, index, value):
+        self._on_change()
+        super().__setitem__(index, value)
+
+    def __delitem__(self, index):
+        self._on_change()
+        super().__delitem__(index)
+
+    def __iadd__(self, items):
+        self._on_change()
+        return super().__iadd__(items)
+
+    def __imul__(self, n):
+        self._on_change()
+        return super().__imul__(n)
+
+    def append(self, item):
+        self._on_change()
+        super().append(item)
+
+    def extend(self, items):
+        self._on_change()
+        super().extend(items)
+
+    def insert(self, index, item):
+        self._on_change()
+        super().insert(index, item)
+
+    def pop(self, index=-1):
+        self._on_change()
+        return super().pop(index)
+
+    def remove(self, item):
+        self._on_change()
+        super().remove(item)
+
+    def clear(self):
+        self._on_change()
+        super().clear()
+
+    def sort(self, *, key=None, reverse=False):
+        self._on_change()
+        super().sort(key=key, reverse=reverse)
+
+    def reverse(self):
+        self._on_change()
+        super().reverse()
+
 
 class Speeds:
     def __init__(self, speeds, original_str=None):
         super().__init__()
-        if original_str is not None:
-            self._original_str = original_str
-            self._original_speeds = speeds
-        else:
-            self._original_str = None
-            self._original_speeds = None
+        self._original_str = original_str
         self.speeds = speeds
+        self._dirty = original_str is None
+
+    @property
+    def speeds(self):
+        """The `(beat, value)` pairs; changes to them are tracked."""
+        return self._speeds
+
+    @speeds.setter
+    def speeds(self, speeds):
+        self._speeds = TrackedList(speeds, self._modified)
+        self._dirty = True
+
+    def _modified(self):
+        self._dirty = True
 
     def __str__(self):
-        if self.speeds == self._original_speeds:
+        if not self._dirty:
             return self._original_str
 
         result = '\n,'.join((
@@ -74,71 +201,538 @@ class Stops(Speeds):
     pass
 
 
+class Row:
+    """A view of one tick of a `Measure`, indexed by column."""
+
+    __slots__ = ('_measure', '_tick')
+
+    def __init__(self, measure, tick):
+        self._measure = measure
+        self._tick = tick
+
+    def __len__(self):
+        return self._measure.columns
+
+    def __getitem__(self, col):
+        if isinstance(col, slice):
+            return [self[c] for c in range(*col.indices(len(self)))]
+        return self._measure._get(self._tick, col)
+
+    def __setitem__(self, col, note):
+        self._measure._set(self._tick, col, note)
+
+    def __iter__(self):
+        measure = self._measure
+        if self._tick % measure._step:
+            return iter('0' * measure.columns)
+        start = self._tick // measure._step * measure.columns
+        return iter(str(measure._data[start:start + measure.columns], 'ascii'))
+
+    def __eq__(self, other):
+        try:
+            return list(self) == list(other)
+        except TypeError:
+            return NotImplemented
+
+    __hash__ = None
+
+    def __str__(self):
+        return ''.join(self)
+
+    def __repr__(self):
+        return '{}({})'.format(self.__class__.__name__, repr(str(self)))
+
+
+class Rows:
+    """A view of the 192 ticks of a `Measure`, indexed by tick."""
+
+    __slots__ = ('_measure',)
+
+    def __init__(self, measure):
+        self._measure = measure
+
+    def __len__(self):
+        return 192
+
+    def __getitem__(self, tick):
+        if isinstance(tick, slice):
+            return [Row(self._measure, t) for t in range(*tick.indices(192))]
+        if not -192 <= tick < 192:
+            raise IndexError('tick out of range')
+        return Row(self._measure, tick % 192)
+
+    def __iter__(self):
+        measure = self._measure
+        for tick in range(192):
+            yield Row(measure, tick)
+
+
+TAP = ord('1')
+HOLD = ord('2')
+TAIL = ord('3')
+ROLL = ord('4')
+MINE = ord('M')
+
+
 class Measure:
+    """One measure of note data.
+
+    Only the rows that exist at the measure's resolution are stored,
+    `columns` bytes per row, in a single buffer. `notes[tick][col]`
+    still works through `Rows`/`Row` views; writing a note off the
+    stored grid refines the grid.
+
+    The ticks that have notes are tracked as notes are written, so
+    `row_dist` is usually a cached value. Notes written through a
+    writable `view` are not seen, so once one has been handed out the
+    ticks are found again on every use.
+    """
+
+    EMPTY = ord('0')
+
     def __init__(self, notes, original_str=None):
         super().__init__()
-        if original_str is not None:
-            self._original_str = original_str
-            self._original_notes = [
-                list(row) for row in notes
-            ]
-        else:
-            self._original_str = None
-            self._original_notes = None
+        self._version = 0
         self.notes = notes
+        self._original_str = original_str
+        self._dirty = original_str is None
+
+    @classmethod
+    def from_buffer(cls, data, columns, original_str=None, copy=True):
+        """Create a measure from `columns` bytes per row, rows evenly
+        spaced over the measure.
+
+        Without `copy`, the measure reads from `data` directly, which
+        may be read-only, and copies it on the first change.
+        """
+        if columns <= 0 or len(data) % columns != 0:
+            raise ParseError()
+        rows = len(data) // columns
+        if rows == 0 or 192 % rows != 0:
+            raise ParseError()
+
+        self = cls.__new__(cls)
+        self._columns = columns
+        self._step = 192 // rows
+        self._data = bytearray(data) if copy else data
+        self._original_str = original_str
+        self._dirty = original_str is None
+        self._version = 0
+        self._forget_rows()
+        return self
+
+    def copy(self):
+        """Return a copy of the notes, without the original text."""
+        return self.from_buffer(self._data, self._columns)
 
     @property
-    def row_dist(self):
-        row_dist = 48
-        for tick in range(192):
-            for note in self.notes[tick]:
-                if note != '0':
-                    row_dist = math.gcd(tick, row_dist)
-        return row_dist
+    def columns(self):
+        return self._columns
 
+    @property
+    def notes(self):
+        return Rows(self)
+
+    @notes.setter
+    def notes(self, notes):
+        rows = [''.join(row).encode('ascii') for row in notes]
+        if len(rows) != 192:
+            raise ValueError('a measure has 192 ticks')
+        columns = len(rows[0])
+        empty = b'0' * columns
+
+        step = 48
+        for tick, row in enumerate(rows):
+            if len(row) != columns:
+                raise ValueError('rows have different lengths')
+            if row != empty:
+                step = math.gcd(tick, step)
+
+        self._columns = columns
+        self._step = step
+        self._data = bytearray(b''.join(rows[::step]))
+        self._forget_rows()
+        self._modified()
+
+    def _modified(self):
+        self._dirty = True
+        self._version += 1
+
+    def _forget_rows(self):
+        # Number of notes on each tick that has any, and the cached
+        # row_dist; None until needed, and never kept while `_data` may
+        # be written through a writable view.
+        self._occupied = None
+        self._row_dist = None
+        self._exposed = False
+
+    def _occupied_ticks(self):
+        if self._occupied is None:
+            occupied = {
+                tick: self._columns - row.count(self.EMPTY)
+                for tick, row in self._scan_rows()
+            }
+            if self._exposed:
+                return occupied
+            self._occupied = occupied
+        return self._occupied
+
+    def _index(self, tick, col):
+        if not -192 <= tick < 192:
+            raise IndexError('tick out of range')
+        if not -self._columns <= col < self._columns:
+            raise IndexError('column out of range')
+        return tick % 192, col % self._columns
+
+    def _get(self, tick, col):
+        tick, col = self._index(tick, col)
+        if tick % self._step:
+            return '0'
+        return chr(self._data[tick // self._step * self._columns + col])
+
+    def _set(self, tick, col, note):
+        tick, col = self._index(tick, col)
+        value = ord(note)
+        if value > 127:
+            raise ValueError('notes must be ASCII characters')
+
+        if tick % self._step:
+            if value == self.EMPTY:
+                return
+            self._refine(math.gcd(tick, self._step))
+
+        i = tick // self._step * self._columns + col
+        old = self._data[i]
+        if old == value:
+            return
+
+        self._own()
+        self._data[i] = value
+        self._modified()
+
+        occupied = self._occupied
+        if occupied is None:
+            self._row_dist = None
+        elif old == self.EMPTY:
+            occupied[tick] = occupied.get(tick, 0) + 1
+            if self._row_dist is not None:
+                self._row_dist = math.gcd(tick, self._row_dist)
+        elif value == self.EMPTY:
+            occupied[tick] -= 1
+            if occupied[tick] == 0:
+                del occupied[tick]
+                self._row_dist = None
+
+    def _own(self):
+        # Copy data shared with a buffer from `from_buffer`.
+        if not isinstance(self._data, bytearray):
+            self._data = bytearray(self._data)
+
+    def _refine(self, step):
+        columns = self._columns
+        factor = self._step // step
+        data = bytearray(b'0' * (192 // step * columns))
+        for row in range(192 // self._step):
+            start = row * factor * columns
+            data[start:start + columns] = \
+                self._data[row * columns:(row + 1) * columns]
+        self._step = step
+        self._data = data
+        # Views of the old data no longer change the measure.
+        self._exposed = False
+
+    @classmethod
+    def from_array(cls, array):
+        """Create a measure from a `(192, columns)` NumPy array of note
+        characters as ASCII codes."""
+        import numpy
+
+        array = numpy.asarray(array, dtype=numpy.uint8)
+        if array.ndim != 2 or array.shape[0] != 192:
+            raise ValueError('expected an array of shape (192, columns)')
+
+        occupied = numpy.flatnonzero((array != cls.EMPTY).any(axis=1))
+        step = int(numpy.gcd.reduce(occupied, initial=48))
+        return cls.from_buffer(array[::step].tobytes(), array.shape[1])
+
+    def view(self, writable=False):
+        """Return the stored rows as a `(rows, columns)` NumPy array.
+
+        The array shares memory with the measure, one row every
+        `192 // rows` ticks. Asking for a writable view marks the
+        measure as modified, and from then on the measure does not cache
+        which ticks have notes. Writes to the view after notes have
+        been set off its grid are lost, as the measure has new storage.
+        """
+        import numpy
+
+        if writable:
+            self._own()
+        array = numpy.frombuffer(self._data, dtype=numpy.uint8)
+        array = array.reshape(-1, self._columns)
+        if writable:
+            self._forget_rows()
+            self._exposed = True
+            self._modified()
+        else:
+            array.flags.writeable = False
+        return array
+
+    def to_array(self):
+        """Return a `(192, columns)` NumPy array of the notes as ASCII
+        codes, with `EMPTY` on ticks without notes."""
+        import numpy
+
+        array = numpy.full((192, self._columns), self.EMPTY, numpy.uint8)
+        array[::self._step] = self.view()
+        return array
+
+    def iter_rows(self):
+        """Yield `(tick, row)` for the stored rows that contain notes.
+
+        Rows are `bytes` of length `columns`.
+        """
+        if self._occupied is None:
+            return self._scan_rows()
+        return (
+            (tick, self._row(tick)) for tick in sorted(self._occupied)
+        )
+
+    def _scan_rows(self):
+        columns = self._columns
+        empty = b'0' * columns
+        data = self._data
+        for row in range(len(data) // columns):
+            notes = bytes(data[row * columns:(row + 1) * columns])
+            if notes != empty:
+                yield row * self._step, notes
+
+    def _row(self, tick):
+        start = tick // self._step * self._columns
+        return bytes(self._data[start:start + self._columns])
+
+    @property
+    def row_dist(self):
+        if self._row_dist is None:
+            row_dist = 48
+            for tick in self._occupied_ticks():
+                row_dist = math.gcd(tick, row_dist)
+                if row_dist == 1:
+                    break
+            if self._exposed:
+                return row_dist
+            self._row_dist = row_dist
+        return self._row_dist
+
+    def format(self, row_dist=None):
+        """Return the notes as text with a row every `row_dist` ticks.
+
+        `row_dist` defaults to the coarsest spacing that keeps all
+        notes. It must divide 48, so that the measure has a multiple of
+        4 rows and can be parsed again. Raises ValueError if it does not,
+        or if a note would fall between rows.
+        """
+        if row_dist is None:
+            row_dist = self.row_dist
+        elif row_dist <= 0 or 48 % row_dist != 0:
+            raise ValueError('row_dist must divide 48: {}'.format(row_dist))
+
+        rows = ['0' * self._columns] * (192 // row_dist)
+        for tick in self._occupied_ticks():
+            if tick % row_dist:
+                raise ValueError(
+                    'tick {} is not on a {}-tick grid'.format(tick, row_dist))
+            rows[tick // row_dist] = self._row(tick).decode('ascii')
+        return '\n' + '\n'.join(rows) + '\n'
 
     def __str__(self):
-        if self.notes == self._original_notes:
-            return self._original_str
-        return '\n' + '\n'.join((
-            ''.join(self.notes[tick])
-            for tick in range(0, 192, self.row_dist)
-        )) + '\n'
+        if not self._dirty:
+            return _text(self._original_str)
+        return self.format()
 
 
 class Notes:
 
     METADATA = ['game', 'credit', 'level', 'feet', 'groove']
 
-    def __init__(self, game, credit, level, feet, groove, measures):
+    def __init__(self, game, credit, level, feet, groove, measures=None,
+                 notedata=None):
         super().__init__()
 
         self._meta = {}
         self._original_meta = {}
-        self._original_meta_clean = {}
+        self._changed_meta = set()
         for key in self.METADATA:
             self._init_meta(key, locals()[key])
 
-        self.measures = measures
+        if measures is None and notedata is None:
+            raise TypeError('either measures or notedata is required')
+        self._measures = measures
+        self._notedata = notedata
+        self._spans = None
+        self._spans_key = None
+
+    @property
+    def measures(self):
+        """The measures of the chart.
+
+        Charts loaded lazily keep their note data as text and only parse
+        it on first access; parse errors are raised from here.
+        """
+        if self._measures is None:
+            self._measures = parse_measures(
+                self._original_meta['game'].strip(), self._notedata)
+            self._notedata = None
+        return self._measures
+
+    @measures.setter
+    def measures(self, measures):
+        self._measures = measures
+        self._notedata = None
+        self._spans = None
+
+    def column_events(self):
+        """Return the notes of the chart grouped by column.
+
+        The result is a list with, for each column, a list of the ticks
+        of its notes and a list of the notes as ASCII codes, in order.
+        Only rows with notes are visited.
+        """
+        measures = self.measures
+        columns = measures[0].columns if measures else 0
+        events = [([], []) for _ in range(columns)]
+        for i, measure in enumerate(measures):
+            for tick, row in measure.iter_rows():
+                tick += i * 192
+                for col, note in enumerate(row):
+                    if note != Measure.EMPTY:
+                        ticks, notes = events[col]
+                        ticks.append(tick)
+                        notes.append(note)
+        instrument.count('notes seen', sum(len(t) for t, _ in events))
+        return events
+
+    @property
+    def spans(self):
+        """The holds and rolls of the chart as `Span`s.
+
+        Spans are sorted by start tick and column. `type` is the note
+        of the head, `'2'` for holds and `'4'` for rolls; heads without
+        a tail are left out. The index is built on first access and
+        rebuilt only after measures have been modified, or on every
+        access while a measure may be written through a writable view.
+        """
+        if any(m._exposed for m in self.measures):
+            return self._find_spans()
+        key = tuple((id(m), m._version) for m in self.measures)
+        if self._spans is None or self._spans_key != key:
+            self._spans = self._find_spans()
+            self._spans_key = key
+        return self._spans
+
+    def _find_spans(self):
+        spans = []
+        for col, (ticks, notes) in enumerate(self.column_events()):
+            head = None
+            for tick, note in zip(ticks, notes):
+                if note == HOLD or note == ROLL:
+                    head = tick, note
+                elif note == TAIL and head is not None:
+                    spans.append(Span(head[0], tick, col, chr(head[1])))
+                    head = None
+        spans.sort(key=lambda span: (span.start, span.column))
+        return spans
+
+    @classmethod
+    def from_array(cls, array, game, credit, level, feet, groove):
+        """Create a chart from a `(ticks, columns)` NumPy array as
+        returned by `to_array`."""
+        if len(array) % 192 != 0:
+            raise ValueError('the number of ticks must be a multiple of 192')
+        measures = [
+            Measure.from_array(array[tick:tick + 192])
+            for tick in range(0, len(array), 192)
+        ]
+        return cls(game, credit, level, feet, groove, measures)
+
+    def to_array(self):
+        """Return the chart as a `(ticks, columns)` NumPy array.
+
+        Notes are ASCII codes and ticks without notes are
+        `Measure.EMPTY`. The array is a copy; edit measures in place
+        through `Measure.view(writable=True)`.
+        """
+        import numpy
+
+        measures = self.measures
+        columns = measures[0].columns if measures else 0
+        array = numpy.full(
+            (len(measures) * 192, columns), Measure.EMPTY, numpy.uint8)
+        for i, measure in enumerate(measures):
+            array[i * 192:(i + 1) * 192:measure._step] = measure.view()
+        return array
+
+    def events(self):
+        """Return the notes of the chart as a sparse event table.
+
+        The result is a tuple of NumPy arrays `(ticks, columns, notes)`
+        sorted by tick, then column, with notes as ASCII codes.
+        """
+        import numpy
+
+        ticks = []
+        columns = []
+        notes = []
+        for i, measure in enumerate(self.measures):
+            view = measure.view()
+            rows, cols = numpy.nonzero(view != Measure.EMPTY)
+            ticks.append(i * 192 + rows * measure._step)
+            columns.append(cols)
+            notes.append(view[rows, cols])
+
+        if not ticks:
+            empty = numpy.zeros(0, numpy.intp)
+            return empty, empty, numpy.zeros(0, numpy.uint8)
+        return (
+            numpy.concatenate(ticks),
+            numpy.concatenate(columns),
+            numpy.concatenate(notes),
+        )
 
     def _init_meta(self, key, value):
-        clean = value.strip()
-        self._meta[key] = clean
-        self._original_meta_clean[key] = clean
+        self._meta[key] = value.strip()
         self._original_meta[key] = value
 
     def _str_meta(self, key):
-        if self._meta[key] == self._original_meta_clean[key]:
+        if key not in self._changed_meta:
             return self._original_meta[key]
         else:
             return '\n     ' + self._meta[key]
 
     def __str__(self):
-        return ':'.join((
+        return ''.join(self.chunks())
+
+    def chunks(self):
+        """Yield the text of the chart in pieces, one per measure."""
+        yield ':'.join((
             self._str_meta(key) for key in self.METADATA
-        )) + ':' + ','.join((
-            str(m) for m in self.measures
-        ))
+        )) + ':'
+
+        if self._measures is None:
+            yield _text(self._notedata)
+            return
+
+        for i, m in enumerate(self._measures):
+            if i > 0:
+                yield ','
+            yield str(m)
+
+    def __setattr__(self, key, value):
+        if key in self.METADATA:
+            self._meta[key] = value
+            self._changed_meta.add(key)
+        else:
+            super().__setattr__(key, value)
 
     def __getattr__(self, key):
         if key in self.METADATA:
@@ -186,9 +780,59 @@ class Simfile:
                 self.notes.append(h)
 
     def __str__(self):
-        return ''.join((
-            str(h) for h in self.headers
-        ))
+        return ''.join(self.chunks())
+
+    def chunks(self):
+        """Yield the text of the simfile in pieces.
+
+        Unmodified measures and charts that were never parsed are
+        copied from the original text.
+        """
+        for h in self.headers:
+            yield from h.chunks()
+
+    def dump(self, fp):
+        """Write the simfile to a text file object, piece by piece."""
+        if instrument.mode is None:
+            for chunk in self.chunks():
+                fp.write(chunk)
+            return
+
+        serialize = write = 0.0
+        chunks = self.chunks()
+        while True:
+            start = time.perf_counter()
+            chunk = next(chunks, None)
+            middle = time.perf_counter()
+            serialize += middle - start
+            if chunk is None:
+                break
+            fp.write(chunk)
+            write += time.perf_counter() - middle
+        instrument.add_time('serialize', serialize)
+        instrument.add_time('write', write)
+
+    def write_to(self, path):
+        """Write the simfile to `path`, replacing it atomically.
+
+        The data is written to a temporary file next to `path`, which
+        then replaces it, so an error halfway leaves `path` intact.
+        """
+        directory, name = os.path.split(os.path.abspath(path))
+        fd, temp_path = tempfile.mkstemp(
+            dir=directory, prefix='.' + name + '.', suffix='.tmp')
+        try:
+            with open(fd, 'w', encoding='utf-8', newline='') as f:
+                self.dump(f)
+                with instrument.phase('sync'):
+                    f.flush()
+                    os.fsync(f.fileno())
+            if os.path.exists(path):
+                os.chmod(temp_path, os.stat(path).st_mode & 0o7777)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
 
 
 def parse_speeds(data):
@@ -215,25 +859,30 @@ def parse_bpms(data):
         return Bpms(bpms, data)
 
 
-def parse_measure(data, num_columns):
-    notes_str = re.sub('(\s|//.*)', '', data)
-    if len(notes_str) % num_columns != 0:
+def parse_measure(data, num_columns, start=0, end=None):
+    if end is None:
+        end = len(data)
+
+    syntax = _syntax(data)
+    original = data[start:end]
+    if syntax.comment in original:
+        notes = syntax.empty.join(syntax.note_row_re.findall(data, start, end))
+    else:
+        notes = syntax.empty.join(original.split())
+
+    if len(notes) % num_columns != 0:
         raise ParseError()
 
-    timesig = len(notes_str) // num_columns
+    timesig = len(notes) // num_columns
     if timesig % 4 != 0 or 192 % timesig != 0:
         raise ParseError()
 
-    notes = [
-        ['0'] * num_columns
-        for _ in range(192)
-    ]
-    for beat in range(timesig):
-        tick = beat * (192 // timesig)
-        for c in range(num_columns):
-            notes[tick][c] = notes_str[beat * num_columns + c]
+    if not notes.isascii():
+        raise ParseError()
+    if isinstance(notes, str):
+        notes = notes.encode('ascii')
 
-    return Measure(notes, data)
+    return Measure.from_buffer(notes, num_columns, original)
 
 
 def get_game_columns(game):
@@ -243,44 +892,46 @@ def get_game_columns(game):
     }[game]
 
 
-def parse_notes(data):
-    try:
-        colon = data.rindex(':')
-    except ValueError:
-        raise ParseError
+def parse_notes(data, start=0, end=None, lazy=False):
+    if end is None:
+        end = len(data)
+
+    colon = data.rfind(_syntax(data).colon, start, end)
+    if colon < 0:
+        raise ParseError()
 
     try:
-        game, credit, level, feet, groove = data[:colon].split(':')
+        game, credit, level, feet, groove = _text(data[start:colon]).split(':')
     except ValueError:
         raise ParseError
 
-    notedata = data[colon+1:]
+    if lazy:
+        return Notes(game, credit, level, feet, groove,
+                     notedata=data[colon+1:end])
+
+    measures = parse_measures(game.strip(), data, colon + 1, end)
+    return Notes(game, credit, level, feet, groove, measures)
+
+
+def parse_measures(game, data, start=0, end=None):
+    if end is None:
+        end = len(data)
 
     try:
-        columns = get_game_columns(game.strip())
+        columns = get_game_columns(game)
     except KeyError:
-        match = re.search('^\s*(\d+)\s*$', notedata, re.MULTILINE)
+        match = _syntax(data).columns_re.search(data, start, end)
         if match is None:
             raise ParseError()
         columns = len(match.group(1))
 
-    def repl(match):
-        return ' ' * len(m.group(0))
-    clean = re.sub('//.*$', repl, notedata, re.MULTILINE)
-    assert len(clean) == len(notedata)
-
-    measures = []
-    pos = 0
-    while pos < len(notedata):
-        try:
-            end = clean.index(',', pos)
-        except ValueError:
-            end = len(notedata)
-
-        measures.append(parse_measure(notedata[pos:end], columns))
-        pos = end + 1
-
-    return Notes(game, credit, level, feet, groove, measures)
+    with instrument.phase('parse measures'):
+        measures = [
+            parse_measure(data, columns, token.start, token.end)
+            for token in tokenize_notes(data, start, end)
+        ]
+    instrument.count('measures parsed', len(measures))
+    return measures
 
 
 def parse_stops(data):
@@ -292,60 +943,124 @@ def parse_stops(data):
         return Stops(stops, data)
 
 
-def parse_header(data, start):
-    assert(data[start] == '#')
+def parse_header(data, start, end, lazy=False):
+    syntax = _syntax(data)
+    assert(data[start:start+1] == syntax.hash)
 
-    end = len(data) - 1
     try:
-        try:
-            end = data.index(';', start)
-        except ValueError:
+        if data[end-1:end] != syntax.semicolon:
             raise ParseError()
 
-        try:
-            colon = data.index(':', start, end)
-        except ValueError:
+        colon = data.find(syntax.colon, start, end)
+        if colon < 0:
             raise ParseError()
 
-        name = data[start+1:colon]
-        value = data[colon+1:end]
+        name = _text(data[start+1:colon])
         if name == 'BPMS':
-            value = parse_bpms(value)
+            value = parse_bpms(_text(data[colon+1:end-1]))
         elif name == 'NOTES':
-            value = parse_notes(value)
+            value = parse_notes(data, colon + 1, end - 1, lazy)
         elif name == 'STOPS':
-            value = parse_stops(value)
+            value = parse_stops(_text(data[colon+1:end-1]))
+        else:
+            value = _text(data[colon+1:end-1])
 
     except ParseError:
         print(traceback.format_exc(), file=sys.stderr)
-        return Invalid(data[start:(end + 1)]), end + 1
+        return Invalid(_text(data[start:end]))
 
     else:
-        return Header(name=name, value=value), end + 1
-
-
-def parse_comment(data, start):
-    pos = start
-    while True:
-        try:
-            pos = data.index('\n', pos) + 1
-        except ValueError:
-            return Comment(data=data, start=start, end=len(data)), len(data)
+        return Header(name=name, value=value)
 
-        if pos >= len(data) or data[pos] == '#':
-            return Comment(data[start:pos]), pos
 
+def tokenize(data):
+    """Split a simfile into header and comment tokens.
 
-def loads(data):
-    headers = []
-
+    A header token spans from its `#` up to and including the closing
+    `;`, or to the end of the data if it is never closed. Everything
+    between headers is split into comment tokens ending just before a
+    line that starts with `#`.
+    """
+    syntax = _syntax(data)
     pos = 0
-    while pos < len(data):
-        if data[pos] == '#':
-            h, pos = parse_header(data, pos)
-            headers.append(h)
+    size = len(data)
+    while pos < size:
+        start = pos
+        if data[pos:pos+1] == syntax.hash:
+            end = data.find(syntax.semicolon, pos)
+            pos = size if end < 0 else end + 1
+            yield Token(HEADER, start, pos)
         else:
-            c, pos = parse_comment(data, pos)
-            headers.append(c)
+            while True:
+                end = data.find(syntax.newline, pos)
+                if end < 0:
+                    pos = size
+                    break
+                pos = end + 1
+                if pos >= size or data[pos:pos+1] == syntax.hash:
+                    break
+            yield Token(COMMENT, start, pos)
+
+
+def tokenize_notes(data, start, end):
+    """Split the note data of a NOTES header into measure tokens."""
+    measure_start = start
+    for match in _syntax(data).measure_end_re.finditer(data, start, end):
+        if match.group(1) is not None:
+            yield Token(MEASURE, measure_start, match.start())
+            measure_start = match.end()
+
+    if measure_start < end:
+        yield Token(MEASURE, measure_start, end)
+
+
+def loads(data, lazy=False):
+    """Parse a simfile.
+
+    With `lazy`, the measures of each chart are only parsed when its
+    `measures` are first accessed, and charts whose measures are never
+    accessed are written back verbatim.
+    """
+    headers = []
+
+    with instrument.phase('tokenize'):
+        tokens = list(tokenize(data))
+
+    with instrument.phase('parse headers'):
+        for token in tokens:
+            if token.kind == HEADER:
+                headers.append(
+                    parse_header(data, token.start, token.end, lazy))
+            else:
+                headers.append(Comment(_text(data[token.start:token.end])))
 
     return Simfile(headers)
+
+
+def loadb(data, lazy=False):
+    """Parse a simfile from a bytes-like object.
+
+    Header values and comments are decoded as UTF-8; note data is kept
+    as bytes and only decoded when it is written back out.
+    """
+    return loads(data, lazy)
+
+
+def load_path(path, lazy=False):
+    """Parse the simfile at `path`, reading it through a memory map.
+
+    If a parse cache is enabled with `pysm.binary.cache_dir`, the
+    simfile is loaded from the cache instead when it is up to date.
+    """
+    if binary.cache_dir is not None:
+        return binary.load_cached(path)
+
+    with open(path, 'rb') as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped.
+            return loadb(b'', lazy)
+
+    with data:
+        return loadb(data, lazy)
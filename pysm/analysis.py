@@ -0,0 +1,240 @@
+"""Note counts, density and pattern statistics of charts.
+
+Steps are taps and hold and roll heads; a row with two steps is a jump
+and one with three or more is a hand. Times come from a
+`pysm.timing.TimingData`. The whole chart is analyzed in a few
+vectorized passes if NumPy is installed, and row by row otherwise.
+"""
+
+from collections import namedtuple
+import bisect
+import itertools
+
+import pysm
+import pysm.timing
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+Analysis = namedtuple('Analysis', [
+    'steps', 'taps', 'holds', 'rolls', 'mines', 'jumps', 'hands',
+    'stream_measures', 'crossovers', 'first', 'last', 'average_nps',
+    'peak_nps', 'peak_time', 'hold_coverage',
+])
+Analysis.__doc__ = """Statistics of one chart.
+
+`first` and `last` are the times of the first and last note of any kind,
+or None for an empty chart. `peak_nps` is the most steps in any window
+of the analysis, per second, starting at `peak_time`. `hold_coverage` is
+the part of the time from `first` to `last` during which a hold or roll
+is held. These times and rates are None if the chart was analyzed
+without timing. Stream measures have at least 16 rows with steps.
+"""
+
+# Rows with steps in a measure of stream.
+STREAM_ROWS = 16
+
+
+def analyze(chart, timing, window=1.0):
+    """Return the `Analysis` of a `pysm.Notes` with the given timing,
+    which may be None.
+
+    NPS is measured over sliding windows of `window` seconds.
+    """
+    if numpy is not None:
+        rows = _rows_array(chart)
+    else:
+        rows = _rows_list(chart)
+    ticks, counts, cols, totals, first, last = rows
+    steps = totals[pysm.TAP] + totals[pysm.HOLD] + totals[pysm.ROLL]
+
+    average = peak = peak_time = coverage = None
+    if timing is not None:
+        peak, peak_time = _peak(timing.seconds(ticks), counts, window)
+        peak /= window
+
+        spans = chart.spans
+        held = _union(
+            timing.seconds([span.start for span in spans]),
+            timing.seconds([span.end for span in spans]))
+
+        if first is not None:
+            first, last = timing.seconds(first), timing.seconds(last)
+        length = last - first if first is not None else 0
+        average = steps / length if length > 0 else 0.0
+        coverage = held / length if length > 0 else 0.0
+    else:
+        first = last = None
+
+    return Analysis(
+        steps=steps,
+        taps=totals[pysm.TAP],
+        holds=totals[pysm.HOLD],
+        rolls=totals[pysm.ROLL],
+        mines=totals[pysm.MINE],
+        jumps=_count(counts, lambda n: n == 2),
+        hands=_count(counts, lambda n: n >= 3),
+        stream_measures=_stream_measures(ticks),
+        crossovers=_crossovers(counts, cols, chart),
+        first=first,
+        last=last,
+        average_nps=average,
+        peak_nps=peak,
+        peak_time=peak_time,
+        hold_coverage=coverage,
+    )
+
+
+def analyze_simfile(simfile, window=1.0):
+    """Return the `Analysis` of every chart of a `pysm.Simfile`.
+
+    Raises ValueError if the simfile has no valid timing.
+    """
+    timing = pysm.timing.TimingData.from_simfile(simfile)
+    return [analyze(chart.value, timing, window) for chart in simfile.notes]
+
+
+def _rows_array(chart):
+    # Rows with steps as arrays of ticks, step counts and the column of
+    # the first step, the totals of each note and the first and last
+    # tick with notes.
+    ticks, columns, notes = chart.events()
+    totals = {
+        note: int(numpy.count_nonzero(notes == note))
+        for note in (pysm.TAP, pysm.HOLD, pysm.ROLL, pysm.MINE)
+    }
+    first = last = None
+    if len(ticks):
+        first, last = int(ticks[0]), int(ticks[-1])
+
+    steps = numpy.isin(notes, (pysm.TAP, pysm.HOLD, pysm.ROLL))
+    ticks, start, counts = numpy.unique(
+        ticks[steps], return_index=True, return_counts=True)
+    return (ticks.astype(float), counts, columns[steps][start], totals,
+            first, last)
+
+
+def _rows_list(chart):
+    ticks = []
+    counts = []
+    cols = []
+    totals = dict.fromkeys((pysm.TAP, pysm.HOLD, pysm.ROLL, pysm.MINE), 0)
+    first = last = None
+    for i, measure in enumerate(chart.measures):
+        for tick, row in measure.iter_rows():
+            tick += i * 192
+            if first is None:
+                first = tick
+            last = tick
+
+            count = 0
+            for note in totals:
+                n = row.count(note)
+                totals[note] += n
+                if note != pysm.MINE:
+                    count += n
+            if count:
+                ticks.append(tick)
+                counts.append(count)
+                cols.append(next(
+                    col for col, note in enumerate(row)
+                    if note in (pysm.TAP, pysm.HOLD, pysm.ROLL)))
+    return ticks, counts, cols, totals, first, last
+
+
+def _count(counts, predicate):
+    if numpy is not None:
+        return int(numpy.count_nonzero(predicate(counts)))
+    return sum(1 for n in counts if predicate(n))
+
+
+def _peak(seconds, counts, window):
+    # The most steps in any window starting at a row, and its start.
+    if len(seconds) == 0:
+        return 0, None
+
+    if numpy is not None:
+        seconds = numpy.asarray(seconds)
+        total = numpy.concatenate(([0], numpy.cumsum(counts)))
+        ends = numpy.searchsorted(seconds, seconds + window, 'left')
+        in_window = total[ends] - total[:-1]
+        best = int(numpy.argmax(in_window))
+        return int(in_window[best]), float(seconds[best])
+
+    total = [0] + list(itertools.accumulate(counts))
+    best = peak = 0
+    end = 0
+    for i, start in enumerate(seconds):
+        end = max(end, bisect.bisect_left(seconds, start + window, end))
+        if total[end] - total[i] > peak:
+            best, peak = i, total[end] - total[i]
+    return peak, seconds[best]
+
+
+def _union(starts, ends):
+    # Total length of the intervals, which are sorted by start.
+    if len(starts) == 0:
+        return 0.0
+
+    if numpy is not None:
+        reach = numpy.maximum.accumulate(ends)
+        before = numpy.concatenate(([-numpy.inf], reach[:-1]))
+        return float(numpy.maximum(
+            reach - numpy.maximum(starts, before), 0).sum())
+
+    total = 0.0
+    reach = None
+    for start, end in zip(starts, ends):
+        if reach is None or start > reach:
+            total += end - start
+            reach = end
+        elif end > reach:
+            total += end - reach
+            reach = end
+    return total
+
+
+def _stream_measures(ticks):
+    if numpy is not None:
+        rows = numpy.bincount((ticks // 192).astype(numpy.intp))
+        return int(numpy.count_nonzero(rows >= STREAM_ROWS))
+
+    rows = {}
+    for tick in ticks:
+        rows[tick // 192] = rows.get(tick // 192, 0) + 1
+    return sum(1 for n in rows.values() if n >= STREAM_ROWS)
+
+
+def _crossovers(counts, cols, chart):
+    # Three single steps in a row from one side of a pad to the other
+    # through the middle: whichever foot starts, it crosses over the
+    # other one. Only pads of four panels are considered.
+    measures = chart.measures
+    if not measures or measures[0].columns % 4 != 0 or len(cols) < 3:
+        return 0
+
+    if numpy is not None:
+        cols = numpy.asarray(cols)
+        single = counts == 1
+        a, b, c = cols[:-2], cols[1:-1], cols[2:]
+        side_a, side_c = a % 4, c % 4
+        crossed = (
+            single[:-2] & single[1:-1] & single[2:]
+            & (a // 4 == b // 4) & (b // 4 == c // 4)
+            & ((b % 4 == 1) | (b % 4 == 2))
+            & (((side_a == 0) & (side_c == 3))
+               | ((side_a == 3) & (side_c == 0))))
+        return int(numpy.count_nonzero(crossed))
+
+    total = 0
+    for i in range(len(cols) - 2):
+        if counts[i] != 1 or counts[i + 1] != 1 or counts[i + 2] != 1:
+            continue
+        a, b, c = cols[i:i + 3]
+        if a // 4 == b // 4 == c // 4 and b % 4 in (1, 2) and \
+                {a % 4, c % 4} == {0, 3}:
+            total += 1
+    return total
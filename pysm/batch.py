@@ -0,0 +1,251 @@
+"""Run a tool over many simfiles, optionally in parallel."""
+
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import functools
+import glob
+import hashlib
+import os
+import sqlite3
+import sys
+import traceback
+
+from pysm import binary
+from pysm import instrument
+
+
+Result = namedtuple('Result', ['path', 'value', 'error', 'stats'])
+Result.__new__.__defaults__ = (None,)
+
+
+def find_simfiles(patterns):
+    """Expand files, directories and glob patterns into `.sm` files.
+
+    Directories are searched recursively. The result is sorted and has
+    no duplicates, so runs over the same inputs are deterministic.
+    """
+    paths = set()
+    for pattern in patterns:
+        matches = glob.glob(pattern, recursive=True) or [pattern]
+        for match in matches:
+            if os.path.isdir(match):
+                for root, dirs, files in os.walk(match):
+                    for name in files:
+                        if name.lower().endswith('.sm'):
+                            paths.add(os.path.join(root, name))
+            else:
+                paths.add(match)
+    return sorted(paths)
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _same_content(path, chunks):
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return False
+
+    with f, instrument.phase('compare'):
+        for chunk in chunks:
+            chunk = chunk.encode('utf-8')
+            if f.read(len(chunk)) != chunk:
+                return False
+        return f.read(1) == b''
+
+
+def rewrite(path, simfile):
+    """Write `simfile` to `path` unless the file already contains it.
+
+    The comparison and the write both stream the simfile piece by piece.
+    Leaving unchanged files alone keeps their mtime. Returns whether the
+    file was written.
+    """
+    if _same_content(path, simfile.chunks()):
+        return False
+
+    simfile.write_to(path)
+    return True
+
+
+class Cache:
+    """Content hashes of the files a tool has already processed.
+
+    A file is current if it still has the hash recorded after the same
+    version of the tool last processed it.
+    """
+
+    def __init__(self, path, tool, version):
+        super().__init__()
+        self.tool = tool
+        self.version = str(version)
+        self._db = sqlite3.connect(path)
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS files ('
+            ' tool TEXT NOT NULL,'
+            ' path TEXT NOT NULL,'
+            ' version TEXT NOT NULL,'
+            ' digest TEXT NOT NULL,'
+            ' PRIMARY KEY (tool, path))')
+
+    def is_current(self, path, digest):
+        row = self._db.execute(
+            'SELECT version, digest FROM files WHERE tool = ? AND path = ?',
+            (self.tool, os.path.abspath(path)),
+        ).fetchone()
+        return row == (self.version, digest)
+
+    def update(self, path, digest):
+        with self._db:
+            self._db.execute(
+                'INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)',
+                (self.tool, os.path.abspath(path), self.version, digest))
+
+    def close(self):
+        self._db.close()
+
+
+def _apply(func, profile, parse_cache, path):
+    # Workers may not inherit the settings of the main process.
+    binary.cache_dir = parse_cache
+    if profile is None:
+        return _call(func, path)
+
+    # Each file is reported on its own.
+    instrument.enable(profile)
+    instrument.reset()
+    result = _call(func, path)
+    return result._replace(stats=instrument.snapshot())
+
+
+def _call(func, path):
+    try:
+        return Result(path, func(path), None)
+    except Exception:
+        return Result(path, None, traceback.format_exc())
+
+
+def run(paths, func, jobs=1):
+    """Yield a `Result` of `func(path)` for each path, in order.
+
+    With more than one job the paths are spread over a process pool, so
+    `func` and its return values must be picklable. Exceptions raised by
+    `func` are caught and reported in `Result.error`. When profiling is
+    enabled, `Result.stats` has the `pysm.instrument.snapshot()` of the
+    file.
+    """
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    jobs = min(jobs, len(paths))
+
+    apply = functools.partial(
+        _apply, func, instrument.mode, binary.cache_dir)
+    if jobs <= 1:
+        yield from map(apply, paths)
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        yield from executor.map(apply, paths)
+
+
+def argument_parser(description=None, cache=False):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument(
+        'paths', nargs='+', metavar='PATH',
+        help='simfiles, directories or glob patterns')
+    parser.add_argument(
+        '-j', '--jobs', type=int, default=1,
+        help='number of worker processes, 0 for one per CPU (default: 1)')
+    if cache:
+        parser.add_argument(
+            '--cache', metavar='FILE',
+            help='skip files that have not changed since they were last '
+                 'processed, keeping track of them in FILE')
+    parser.add_argument(
+        '--parse-cache', metavar='DIR',
+        help='keep parsed simfiles in DIR and load them from there while '
+             'they are unchanged (default: from the PYSM_CACHE environment '
+             'variable)')
+    parser.add_argument(
+        '--profile', choices=instrument.MODES,
+        help='print timings and counters to stderr, as a summary of the '
+             'whole run or as JSON lines per file (default: from the '
+             'PYSM_PROFILE environment variable)')
+    return parser
+
+
+def _unprocessed(paths, cache):
+    for path in paths:
+        try:
+            if cache.is_current(path, file_digest(path)):
+                continue
+        except OSError:
+            pass
+        yield path
+
+
+def configure(args):
+    """Apply the `--profile` and `--parse-cache` options in `args`."""
+    if getattr(args, 'profile', None) is not None:
+        instrument.enable(args.profile)
+    if getattr(args, 'parse_cache', None) is not None:
+        binary.cache_dir = args.parse_cache
+
+
+def report(stats):
+    """Print the merged summary of `Result.stats` when profiling."""
+    if instrument.mode == 'summary':
+        instrument.reset()
+        for item in stats:
+            instrument.merge(item)
+        instrument.report(files=len(stats))
+
+
+def main(func, args, tool=None):
+    """Run `func` over the paths in `args` and print the results.
+
+    `tool` is a `(name, version)` pair identifying the tool in the cache
+    given by `args.cache`, if any; `func` must then rewrite files in
+    place. Returns an exit status: 1 if any file failed, 0 otherwise.
+    """
+    configure(args)
+    paths = find_simfiles(args.paths)
+
+    cache = None
+    if getattr(args, 'cache', None) is not None:
+        cache = Cache(args.cache, *tool)
+        paths = list(_unprocessed(paths, cache))
+
+    status = 0
+    stats = []
+    for result in run(paths, func, args.jobs):
+        if result.stats is not None:
+            stats.append(result.stats)
+            if instrument.mode == 'json':
+                instrument.report(result.stats, path=result.path)
+
+        if result.error is not None:
+            status = 1
+            print('{}: {}'.format(result.path, result.error),
+                  end='', file=sys.stderr)
+            continue
+
+        if cache is not None:
+            cache.update(result.path, file_digest(result.path))
+        if result.value:
+            if len(paths) > 1:
+                print('==> {} <=='.format(result.path))
+            print(result.value, end='')
+            sys.stdout.flush()
+
+    if cache is not None:
+        cache.close()
+    report(stats)
+    return status
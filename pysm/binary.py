@@ -0,0 +1,244 @@
+"""Compact binary cache of parsed simfiles.
+
+A cache file holds a parsed simfile together with the path, size and
+modification time of its source, so it can be checked against the source
+and loaded instead of parsing the text again. Header values are stored
+with `marshal`, and the note data of every measure is stored packed, one
+byte per column and row, followed by its original text.
+
+Cache files are read through a memory map and measures refer to the map
+until they are changed, so processes loading the same cache file share
+its pages.
+
+Enable the cache for `pysm.load_path` by setting `cache_dir`, or with
+the `PYSM_CACHE` environment variable.
+"""
+
+from array import array
+import hashlib
+import marshal
+import mmap
+import os
+import struct
+import tempfile
+
+import pysm
+from pysm import instrument
+
+
+MAGIC = b'PYSMC\x00\x01\n'
+
+# Directory of cache files used by `pysm.load_path`, or None.
+cache_dir = os.environ.get('PYSM_CACHE') or None
+
+_LENGTH = struct.Struct('<Q')
+
+# Per measure: data offset, data length, columns, original text offset
+# and length, or -1 if the measure has no original text.
+_FIELDS = 5
+
+
+class StaleError(ValueError):
+    """The cache file does not match its source, or is not a cache file."""
+
+
+def _source_key(path):
+    st = os.stat(path)
+    return os.path.abspath(path), st.st_size, st.st_mtime_ns
+
+
+def _encode(data):
+    if isinstance(data, str):
+        return data.encode('utf-8')
+    return bytes(data)
+
+
+class _Writer:
+    def __init__(self):
+        super().__init__()
+        self.blob = bytearray()
+
+    def add(self, data):
+        offset = len(self.blob)
+        self.blob += data
+        return offset
+
+    def header(self, header):
+        if isinstance(header, pysm.Comment):
+            return ('comment', header.value)
+        if isinstance(header, pysm.Invalid):
+            return ('invalid', header.value)
+        return ('header', header.name, self.value(header.value))
+
+    def value(self, value):
+        if isinstance(value, pysm.Notes):
+            return self.notes(value)
+        if isinstance(value, pysm.Speeds):
+            original = None if value._dirty else value._original_str
+            kind = 'bpms' if isinstance(value, pysm.Bpms) else 'stops'
+            return (kind, [tuple(speed) for speed in value.speeds], original)
+        if isinstance(value, pysm.Invalid):
+            return ('invalid', value.value)
+        return ('text', value)
+
+    def notes(self, notes):
+        table = array('q')
+        for m in notes.measures:
+            table.append(self.add(m._data))
+            table.append(len(m._data))
+            table.append(m.columns)
+            if m._dirty:
+                table.extend((-1, -1))
+            else:
+                original = _encode(m._original_str)
+                table.append(self.add(original))
+                table.append(len(original))
+        meta = [notes._str_meta(key) for key in pysm.Notes.METADATA]
+        return ('notes', meta, table.tobytes())
+
+
+def dump(simfile, fp, source=None):
+    """Write `simfile` to the binary file object `fp`.
+
+    `source` is the path of the file the simfile was loaded from; `load`
+    checks that it has not changed since.
+    """
+    _dump(simfile, fp, _source_key(source) if source is not None else None)
+
+
+def _dump(simfile, fp, key):
+    writer = _Writer()
+    record = {
+        'source': key,
+        'headers': [writer.header(h) for h in simfile.headers],
+    }
+    meta = marshal.dumps(record)
+
+    fp.write(MAGIC)
+    fp.write(_LENGTH.pack(len(meta)))
+    fp.write(meta)
+    fp.write(writer.blob)
+
+
+def save(simfile, path, source=None):
+    """Write `simfile` to the cache file `path`, replacing it atomically."""
+    _save(simfile, path, _source_key(source) if source is not None else None)
+
+
+def _save(simfile, path, key):
+    directory, name = os.path.split(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(
+        dir=directory, prefix='.' + name + '.', suffix='.tmp')
+    try:
+        with open(fd, 'wb') as f:
+            _dump(simfile, f, key)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+class _Reader:
+    def __init__(self, blob):
+        super().__init__()
+        self.blob = blob
+
+    def header(self, item):
+        if item[0] == 'comment':
+            return pysm.Comment(item[1])
+        if item[0] == 'invalid':
+            return pysm.Invalid(item[1])
+        return pysm.Header(item[1], self.value(item[2]))
+
+    def value(self, item):
+        kind = item[0]
+        if kind == 'notes':
+            return self.notes(item[1], item[2])
+        if kind == 'bpms':
+            return pysm.Bpms(item[1], item[2])
+        if kind == 'stops':
+            return pysm.Stops(item[1], item[2])
+        if kind == 'invalid':
+            return pysm.Invalid(item[1])
+        return item[1]
+
+    def notes(self, meta, table_bytes):
+        blob = self.blob
+        table = array('q')
+        table.frombytes(table_bytes)
+
+        measures = []
+        for i in range(0, len(table), _FIELDS):
+            start, length, columns, original, original_length = table[i:i + _FIELDS]
+            if original >= 0:
+                original = blob[original:original + original_length]
+            else:
+                original = None
+            measures.append(pysm.Measure.from_buffer(
+                blob[start:start + length], columns, original, copy=False))
+        return pysm.Notes(*meta, measures=measures)
+
+
+def load(path, source=None):
+    """Load a simfile from the cache file `path`.
+
+    Raises StaleError if `path` is not a cache file, or if `source` is
+    given and is not the unchanged file the cache was made from.
+    """
+    with open(path, 'rb') as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise StaleError('empty cache file')
+
+    # The map stays open as long as measures refer to it.
+    start = len(MAGIC) + _LENGTH.size
+    if len(data) < start or data[:len(MAGIC)] != MAGIC:
+        raise StaleError('not a cache file')
+    length, = _LENGTH.unpack_from(data, len(MAGIC))
+    try:
+        record = marshal.loads(data[start:start + length])
+    except (EOFError, ValueError, TypeError):
+        raise StaleError('truncated cache file')
+
+    if source is not None and record['source'] != _source_key(source):
+        raise StaleError('source changed')
+
+    reader = _Reader(memoryview(data)[start + length:])
+    return pysm.Simfile([reader.header(h) for h in record['headers']])
+
+
+def cache_path(directory, source):
+    """Return the cache file for the simfile `source` in `directory`."""
+    key = os.path.abspath(source).encode('utf-8', 'surrogateescape')
+    return os.path.join(directory, hashlib.sha1(key).hexdigest() + '.pysmc')
+
+
+def load_cached(source, directory=None):
+    """Load the simfile `source`, through a cache file if it is current.
+
+    Otherwise the simfile is parsed and a new cache file is written to
+    `directory`, which defaults to `cache_dir`.
+    """
+    if directory is None:
+        directory = cache_dir
+    path = cache_path(directory, source)
+
+    with instrument.phase('load cache'):
+        try:
+            simfile = load(path, source)
+        except (OSError, ValueError):
+            pass
+        else:
+            instrument.count('cache hits')
+            return simfile
+
+    # A change during the read leaves the cache file stale, not wrong.
+    key = _source_key(source)
+    with open(source, 'rb') as f:
+        simfile = pysm.loadb(f.read())
+
+    os.makedirs(directory, exist_ok=True)
+    with instrument.phase('save cache'):
+        _save(simfile, path, key)
+    return simfile
@@ -0,0 +1,117 @@
+"""An indexed binary min-heap with changeable priorities."""
+
+
+class IndexedHeap:
+    """A min-heap of hashable keys whose priorities can be changed.
+
+    `heap[key] = priority` inserts a key or changes its priority in
+    O(log n), and `popitem()` removes and returns the `(key, priority)`
+    pair with the lowest priority. Keys and priorities are kept in
+    parallel lists with a dict from key to position, so there are no
+    per-entry objects. Ties are broken arbitrarily but deterministically.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._keys = []
+        self._priorities = []
+        self._index = {}
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __getitem__(self, key):
+        return self._priorities[self._index[key]]
+
+    def __setitem__(self, key, priority):
+        i = self._index.get(key)
+        if i is None:
+            i = len(self._keys)
+            self._keys.append(key)
+            self._priorities.append(priority)
+            self._index[key] = i
+            self._sift_up(i)
+            return
+
+        old = self._priorities[i]
+        if priority < old:
+            self._priorities[i] = priority
+            self._sift_up(i)
+        elif priority > old:
+            self._priorities[i] = priority
+            self._sift_down(i)
+
+    def __delitem__(self, key):
+        i = self._index.pop(key)
+        last_key = self._keys.pop()
+        last_priority = self._priorities.pop()
+        if i == len(self._keys):
+            return
+
+        self._keys[i] = last_key
+        self._priorities[i] = last_priority
+        self._index[last_key] = i
+        if i > 0 and last_priority < self._priorities[(i - 1) >> 1]:
+            self._sift_up(i)
+        else:
+            self._sift_down(i)
+
+    def peekitem(self):
+        return self._keys[0], self._priorities[0]
+
+    def popitem(self):
+        """Remove and return the key with the lowest priority.
+
+        Raises KeyError if the heap is empty.
+        """
+        if not self._keys:
+            raise KeyError('popitem(): heap is empty')
+
+        key = self._keys[0]
+        priority = self._priorities[0]
+        del self[key]
+        return key, priority
+
+    def _sift_up(self, i):
+        keys = self._keys
+        priorities = self._priorities
+        index = self._index
+        key = keys[i]
+        priority = priorities[i]
+        while i > 0:
+            parent = (i - 1) >> 1
+            if priorities[parent] <= priority:
+                break
+            keys[i] = keys[parent]
+            priorities[i] = priorities[parent]
+            index[keys[i]] = i
+            i = parent
+        keys[i] = key
+        priorities[i] = priority
+        index[key] = i
+
+    def _sift_down(self, i):
+        keys = self._keys
+        priorities = self._priorities
+        index = self._index
+        size = len(keys)
+        key = keys[i]
+        priority = priorities[i]
+        while True:
+            child = 2 * i + 1
+            if child >= size:
+                break
+            if child + 1 < size and priorities[child + 1] < priorities[child]:
+                child += 1
+            if priorities[child] >= priority:
+                break
+            keys[i] = keys[child]
+            priorities[i] = priorities[child]
+            index[keys[i]] = i
+            i = child
+        keys[i] = key
+        priorities[i] = priority
+        index[key] = i
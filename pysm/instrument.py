@@ -0,0 +1,138 @@
+"""Opt-in timings and counters for finding out where time goes.
+
+Enable with the `PYSM_PROFILE` environment variable set to `summary` (or
+`1`) or `json`, or with the `--profile` option of the tools; `0` or an
+empty value leaves it off, and other values are ignored with a warning.
+Phases are timed inclusively, so nested phases are also part of the
+enclosing one.
+"""
+
+from collections import defaultdict
+import json
+import os
+import sys
+import time
+
+
+MODES = ['summary', 'json']
+
+# None when disabled, otherwise one of MODES.
+mode = None
+
+_seconds = defaultdict(float)
+_calls = defaultdict(int)
+_counters = defaultdict(int)
+
+
+class _Phase:
+    __slots__ = ('_name', '_start')
+
+    def __init__(self, name):
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        add_time(self._name, time.perf_counter() - self._start)
+
+
+class _NoPhase:
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NO_PHASE = _NoPhase()
+
+
+def enable(new_mode='summary'):
+    global mode
+    if new_mode not in MODES:
+        raise ValueError('unknown profile mode: {}'.format(new_mode))
+    mode = new_mode
+
+
+def phase(name):
+    """Return a context manager that times a phase."""
+    if mode is None:
+        return _NO_PHASE
+    return _Phase(name)
+
+
+def add_time(name, seconds, calls=1):
+    _seconds[name] += seconds
+    _calls[name] += calls
+
+
+def count(name, n=1):
+    if mode is not None:
+        _counters[name] += n
+
+
+def snapshot():
+    """Return the timings and counters recorded so far as a dict."""
+    return {
+        'phases': {
+            name: {'seconds': _seconds[name], 'calls': _calls[name]}
+            for name in _seconds
+        },
+        'counters': dict(_counters),
+    }
+
+
+def reset():
+    _seconds.clear()
+    _calls.clear()
+    _counters.clear()
+
+
+def merge(stats):
+    """Add a `snapshot()`, e.g. from a worker process."""
+    for name, item in stats['phases'].items():
+        add_time(name, item['seconds'], item['calls'])
+    for name, n in stats['counters'].items():
+        _counters[name] += n
+
+
+def report(stats=None, file=sys.stderr, **fields):
+    """Print a `snapshot()`, by default of everything recorded so far.
+
+    In `json` mode this is one JSON object per call, with `fields`
+    added to it.
+    """
+    if stats is None:
+        stats = snapshot()
+    if mode == 'json':
+        print(json.dumps(dict(fields, **stats)), file=file)
+        return
+
+    for key, value in sorted(fields.items()):
+        print('{}: {}'.format(key, value), file=file)
+    for name, item in sorted(
+            stats['phases'].items(), key=lambda i: -i[1]['seconds']):
+        print('{:<20} {:>10.4f}s {:>8} calls'.format(
+            name, item['seconds'], item['calls']), file=file)
+    for name, n in sorted(stats['counters'].items()):
+        print('{:<20} {:>11}'.format(name, n), file=file)
+
+
+def _enable_from_environment():
+    value = os.environ.get('PYSM_PROFILE', '').strip().lower()
+    if value in ('', '0'):
+        return
+    if value == '1':
+        value = 'summary'
+    if value in MODES:
+        enable(value)
+    else:
+        print('warning: ignoring PYSM_PROFILE={}, expected one of 0, 1, {}'
+              .format(os.environ['PYSM_PROFILE'], ', '.join(MODES)),
+              file=sys.stderr)
+
+
+_enable_from_environment()
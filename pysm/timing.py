@@ -0,0 +1,137 @@
+"""Conversion between chart ticks and song time in seconds."""
+
+import bisect
+import numbers
+
+import pysm
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+TICKS_PER_BEAT = 48
+
+
+class TimingData:
+    """Song timing from BPM changes, stops and the offset.
+
+    Ticks count from the start of the chart, 192 per measure. Time is in
+    seconds from the start of the music, so tick 0 is at `-offset` like
+    in StepMania. Notes on the beat of a stop happen before it.
+
+    Timing is precomputed as a piecewise linear table, so conversions
+    are binary searches. Both directions accept a single number, a
+    sequence (returning a list) or a NumPy array (returning an array,
+    converted in one vectorized call).
+    """
+
+    def __init__(self, bpms, stops=(), offset=0.0):
+        super().__init__()
+        if not bpms:
+            raise ValueError('at least one BPM is required')
+
+        events = []
+        for beat, bpm in bpms:
+            if bpm <= 0:
+                raise ValueError('BPM must be positive: {}'.format(bpm))
+            events.append((beat * TICKS_PER_BEAT, 0, bpm))
+        for beat, duration in stops:
+            if duration < 0:
+                raise ValueError('stops must not be negative: {}'.format(duration))
+            if duration > 0:
+                events.append((beat * TICKS_PER_BEAT, 1, duration))
+        events.sort()
+
+        # The first BPM also applies before it starts.
+        spt = 60 / (min(bpms)[1] * TICKS_PER_BEAT)
+        tick = 0
+        seconds = -offset
+
+        self._ticks = []
+        self._seconds = []
+        self._spt = []
+        self._tps = []
+        if events[0][0] > 0:
+            self._add(tick, seconds, spt, 1 / spt)
+
+        for event_tick, kind, value in events:
+            seconds += (event_tick - tick) * spt
+            tick = event_tick
+            if kind == 0:
+                spt = 60 / (value * TICKS_PER_BEAT)
+                self._add(tick, seconds, spt, 1 / spt)
+            else:
+                self._add(tick, seconds, spt, 0)
+                seconds += value
+                self._add(tick, seconds, spt, 1 / spt)
+
+    def _add(self, tick, seconds, spt, tps):
+        self._ticks.append(tick)
+        self._seconds.append(seconds)
+        self._spt.append(spt)
+        self._tps.append(tps)
+
+    @classmethod
+    def from_simfile(cls, simfile):
+        """Create the timing of a `pysm.Simfile`.
+
+        Raises ValueError if the simfile has no valid BPMS or has invalid
+        STOPS or OFFSET.
+        """
+        bpms = simfile.bpms.value if simfile.bpms is not None else None
+        if not isinstance(bpms, pysm.Bpms):
+            raise ValueError('simfile has no valid BPMS')
+
+        stops = []
+        if simfile.stops is not None:
+            if isinstance(simfile.stops.value, pysm.Stops):
+                stops = simfile.stops.value.speeds
+            elif str(simfile.stops.value).strip():
+                raise ValueError('simfile has invalid STOPS')
+
+        offset = 0.0
+        if simfile.offset is not None and simfile.offset.value.strip():
+            offset = float(simfile.offset.value)
+
+        return cls(bpms.speeds, stops, offset)
+
+    def seconds(self, ticks):
+        """Convert ticks to seconds."""
+        if isinstance(ticks, numbers.Real):
+            return self._seconds_at(ticks)
+        if numpy is not None and isinstance(ticks, numpy.ndarray):
+            i = numpy.searchsorted(self._ticks, ticks, 'left') - 1
+            i = numpy.maximum(i, 0)
+            return (numpy.take(self._seconds, i)
+                    + (ticks - numpy.take(self._ticks, i))
+                    * numpy.take(self._spt, i))
+        return [self._seconds_at(t) for t in ticks]
+
+    def _seconds_at(self, tick):
+        i = max(bisect.bisect_left(self._ticks, tick) - 1, 0)
+        return self._seconds[i] + (tick - self._ticks[i]) * self._spt[i]
+
+    def ticks(self, seconds):
+        """Convert seconds to (fractional) ticks.
+
+        Times during a stop map to the tick of the stop.
+        """
+        if isinstance(seconds, numbers.Real):
+            return self._ticks_at(seconds)
+        if numpy is not None and isinstance(seconds, numpy.ndarray):
+            i = numpy.searchsorted(self._seconds, seconds, 'right') - 1
+            before = i < 0
+            i = numpy.maximum(i, 0)
+            tps = numpy.take(self._tps, i)
+            tps[before] = 1 / self._spt[0]
+            return (numpy.take(self._ticks, i)
+                    + (seconds - numpy.take(self._seconds, i)) * tps)
+        return [self._ticks_at(s) for s in seconds]
+
+    def _ticks_at(self, seconds):
+        i = bisect.bisect_right(self._seconds, seconds) - 1
+        if i < 0:
+            return self._ticks[0] + (seconds - self._seconds[0]) / self._spt[0]
+        return self._ticks[i] + (seconds - self._seconds[i]) * self._tps[i]
@@ -0,0 +1,35 @@
+"""Transforms that rewrite the notes of charts in place."""
+
+import pysm
+
+
+# Roll length in ticks by the distance to the next note in the same
+# column, capped at 16 ticks.
+_ROLL_TAILS = [1] * 4 + [2] * 2 + [3] * 2 + [4] * 2 + [6] * 6 + [12]
+
+
+def short_rolls(*charts):
+    """Convert all normal notes of the given `pysm.Notes` to short rolls.
+
+    Each roll ends well before the next note in its column or the end of
+    the chart. Raises ValueError if a note is directly followed by
+    another one.
+    """
+    for chart in charts:
+        measures = chart.measures
+        end = len(measures) * 192
+        for col, (ticks, notes) in enumerate(chart.column_events()):
+            for i, tick in enumerate(ticks):
+                if notes[i] != pysm.TAP:
+                    continue
+
+                next_tick = ticks[i + 1] if i + 1 < len(ticks) else end
+                distance = min(next_tick - tick, 16)
+                if distance < 2:
+                    raise ValueError(
+                        'no room for a roll at tick {} in column {}'.format(
+                            tick, col))
+
+                tail = tick + _ROLL_TAILS[distance]
+                measures[tick // 192].notes[tick % 192][col] = '4'
+                measures[tail // 192].notes[tail % 192][col] = '3'
@@ -0,0 +1,30 @@
+import unittest
+
+import pysm
+
+
+class FormatTest(unittest.TestCase):
+
+    def measure(self):
+        measure = pysm.Measure.from_buffer(b'1000' + b'0000' * 3, 4)
+        measure.notes[96][3] = '2'
+        return measure
+
+    def test_rejects_unparseable_spacing(self):
+        measure = self.measure()
+        for row_dist in (0, 64, 96, 192):
+            with self.assertRaises(ValueError):
+                measure.format(row_dist)
+
+    def test_accepted_spacing_parses_back(self):
+        measure = self.measure()
+        for row_dist in range(1, 49):
+            if 48 % row_dist != 0:
+                continue
+            text = measure.format(row_dist)
+            parsed = pysm.parse_measure(text, 4)
+            self.assertEqual(parsed.format(), measure.format())
+
+
+if __name__ == '__main__':
+    unittest.main()